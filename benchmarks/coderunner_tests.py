@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Measures how writing the test cases of a CodeRunner question scales.
+
+Writes a problem with 10, 1k and 10k small tests and shows the time taken per
+number of tests (and per test). Usage:
+
+    python3 benchmarks/coderunner_tests.py [--repeat N] [NUM_TESTS ...]
+"""
+
+from argparse import ArgumentParser
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'convert_ej'))
+import problem  # noqa: E402
+import writers  # noqa: E402
+
+
+def make_problem(num_tests):
+    """Return a Problem with the given number of (hidden) tests."""
+    examples = [{'in': '1 2\n', 'out': '3\n'}]
+    statement = problem.Statement('Sum', 'Add two numbers.', 'Two integers.',
+                                  'Their sum.', examples)
+    tests = {'examples': {'000': examples[0]},
+             'hidden': {f'{i:05}': {'in': f'{i} {i}\n', 'out': f'{2 * i}\n'}
+                        for i in range(1, num_tests)}}
+    evaluation = problem.Evaluation(tests,
+                                    [{'py': 'print(sum(map(int, input().split())))'}],
+                                    {'time_sec': 1, 'memory_MB': 256,
+                                     'maxfilesize_KB': 1024})
+    return problem.Problem('sum', statement, evaluation)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('num_tests', type=int, nargs='*',
+                        default=[10, 1000, 10000])
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Best of this many runs (default 3)')
+    args = parser.parse_args()
+
+    writer = writers.CodeRunner()
+    print(f'{"tests":>8} {"best (s)":>10} {"per test (us)":>14}')
+    with tempfile.TemporaryDirectory() as output_dir:
+        for num_tests in args.num_tests:
+            ejproblem = make_problem(num_tests)
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    writer.write(ejproblem, output_dir, src_lang='py')
+                best = min(best, time.perf_counter() - start)
+            print(f'{num_tests:>8} {best:>10.4f} '
+                  f'{best / num_tests * 1e6:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
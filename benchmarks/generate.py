@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Generates synthetic Polygon and BOCA packages for benchmarking.
+
+The packages are reproducible (the same arguments always give the same
+files), with configurable number and size of tests, number and size of images
+and length of the statement. Usage:
+
+    python3 benchmarks/generate.py {Polygon,BOCA} OUTPUT_DIR [options]
+"""
+
+from argparse import ArgumentParser
+import os
+import random
+import struct
+import zipfile
+import zlib
+
+CHECKER = r'''#include "testlib.h"
+
+int main(int argc, char* argv[]) {
+    registerTestlibCmd(argc, argv);
+    while (!ans.seekEof()) {
+        if (ouf.readToken() != ans.readToken())
+            quitf(_wa, "tokens differ");
+    }
+    quitf(_ok, "tokens match");
+}
+'''
+SOLUTION = r'''#include <iostream>
+
+int main() {
+    long long x, sum = 0;
+    while (std::cin >> x)
+        sum += x;
+    std::cout << sum << std::endl;
+}
+'''
+ACCEPTED = 'import sys\nprint(sum(map(int, sys.stdin.read().split())))\n'
+LIMITS = 'echo 1\necho 1\necho 256\necho 1024\nexit 0\n'
+
+# Pieces of TeX the statements are made of, so the converters have something
+# to work on (math, fonts, lists, quotes...).
+PARAGRAPHS = [
+    'Given $N$ integers $a_1, a_2, \\ldots, a_N$, print their sum. Each '
+    '\\textbf{integer} fits in a \\texttt{long long} and $1 \\le N \\le '
+    '10^5$.',
+    'The ``sum\'\' of a sequence is defined as usual, that is, \\[ S = '
+    '\\sum_{i=1}^{N} a_i. \\] Note that \\emph{negative} numbers may appear.',
+    'Some remarks:\n\\begin{itemize}\n\\item the input may have extra '
+    'spaces;\n\\item the answer may be \\textit{large}.\n\\end{itemize}',
+    '\\begin{center}\nAll values are given in \\textbf{decimal '
+    '\\textit{notation}}.\n\\end{center}',
+]
+
+
+def numbers(rng, size):
+    """Return about size bytes of lines of random integers (as bytes)."""
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(str(rng.randrange(-10 ** 9, 10 ** 9))
+                        for _ in range(10))
+        lines.append(line)
+        length += len(line) + 1
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def png(rng, size):
+    """Return a PNG image of (about) size bytes, of random pixels."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data)))
+
+    side = max(1, int((size / 3) ** 0.5))
+    rows = b''.join(b'\0' + rng.getrandbits(24 * side).to_bytes(3 * side,
+                                                                 'little')
+                    for _ in range(side))
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, 1)) + chunk(b'IEND', b''))
+
+
+def statement(rng, size, images):
+    """Return a TeX statement of about size bytes, including the images."""
+    parts = [f'\\includegraphics[width=0.5\\textwidth]{{{image}}}\n'
+             for image in images]
+    length = sum(map(len, parts))
+    while length < size:
+        paragraph = rng.choice(PARAGRAPHS)
+        parts.append(f'{paragraph}\n\n')
+        length += len(paragraph) + 2
+    return ''.join(parts)
+
+
+def problem_id(num_tests=10, test_KB=1, num_images=0, statement_KB=2, **_):
+    """Return the id of the problem generated with the given arguments."""
+    return f'bench-{num_tests}-{test_KB}-{num_images}-{statement_KB}'
+
+
+def contents(num_tests=10, test_KB=1, num_images=0, image_KB=64,
+             statement_KB=2, num_examples=2, seed=0):
+    """Return the (reproducible) contents of a problem, as a dict."""
+    rng = random.Random(seed)
+    tests = []
+    for i in range(num_tests):
+        data = numbers(rng, test_KB * 1024 if i >= num_examples else 64)
+        total = sum(int(x) for x in data.split())
+        tests.append((data, f'{total}\n'.encode('ascii')))
+
+    images = {f'figure{i}.png': png(rng, image_KB * 1024)
+              for i in range(num_images)}
+    return {'id': problem_id(num_tests, test_KB, num_images, statement_KB),
+            'title': 'Synthetic Sum',
+            'legend': statement(rng, statement_KB * 1024, list(images)),
+            'input': 'The input has $N$ integers.',
+            'output': 'Print their sum.',
+            'notes': 'The sum may be \\textbf{negative}.',
+            'tutorial': 'Just add them.',
+            'tests': tests,
+            'images': images,
+            'num_examples': min(num_examples, num_tests)}
+
+
+def polygon(path, **kwargs):
+    """Write a Polygon package to path (see contents for the arguments)."""
+    problem = contents(**kwargs)
+    tests = problem['tests']
+    width = max(2, len(str(len(tests))))
+    stmt = 'statement-sections/english'
+    xml_tests = '\n'.join(
+        '<test method="manual" sample="true"/>'
+        if i < problem['num_examples'] else '<test method="manual"/>'
+        for i in range(len(tests)))
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as pzip:
+        pzip.writestr('problem.xml', f'''<?xml version="1.0" encoding="utf-8"?>
+<problem revision="1" short-name="{problem['id']}">
+<judging><testset name="tests">
+<time-limit>1000</time-limit>
+<memory-limit>268435456</memory-limit>
+<test-count>{len(tests)}</test-count>
+<tests>
+{xml_tests}
+</tests>
+</testset></judging>
+<assets>
+<checker type="testlib"><copy path="check.cpp"/></checker>
+<solutions>
+<solution tag="main"><source path="solutions/sum.cpp" type="cpp.g++17"/>
+</solution>
+<solution tag="accepted"><source path="solutions/sum.py" type="python.3"/>
+</solution>
+</solutions>
+</assets>
+</problem>
+''')
+        pzip.writestr('check.cpp', CHECKER)
+        pzip.writestr('solutions/sum.cpp', SOLUTION)
+        pzip.writestr('solutions/sum.py', ACCEPTED)
+        pzip.writestr('tags', 'math\nimplementation\n')
+        for section in ('legend', 'input', 'output', 'notes', 'tutorial'):
+            pzip.writestr(f'{stmt}/{section}.tex', problem[section])
+        pzip.writestr(f'{stmt}/name.tex', problem['title'])
+        for name, data in problem['images'].items():
+            pzip.writestr(f'{stmt}/{name}', data)
+        for i, (data, answer) in enumerate(tests, 1):
+            pzip.writestr(f'tests/{i:0{width}}', data)
+            pzip.writestr(f'tests/{i:0{width}}.a', answer)
+            if i <= problem['num_examples']:
+                pzip.writestr(f'{stmt}/example.{i:02}', data)
+                pzip.writestr(f'{stmt}/example.{i:02}.a', answer)
+
+
+def boca(path, **kwargs):
+    """Write a BOCA package to path (see contents for the arguments)."""
+    problem = contents(**kwargs)
+    tests = problem['tests']
+    width = max(2, len(str(len(tests))))
+    names = [f'{i:0{width}}' for i in range(1, len(tests) + 1)]
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as pzip:
+        pzip.writestr('description/problem.info',
+                      f'basename={problem["id"]}\n'
+                      f'fullname={problem["title"]}\n'
+                      f'descfile={problem["id"]}.pdf\n')
+        pzip.writestr('description/tags.csv', 'math,implementation')
+        pzip.writestr('tex/description.tex', problem['legend'])
+        for section in ('input', 'output', 'notes', 'tutorial'):
+            pzip.writestr(f'tex/{section}.tex', problem[section])
+        pzip.writestr('tex/examples.csv',
+                      ','.join(names[:problem['num_examples']]))
+        for name, data in problem['images'].items():
+            pzip.writestr(f'tex/{name}', data)
+        pzip.writestr('solutions/main.cpp', SOLUTION)
+        pzip.writestr('solutions/accepted.py', ACCEPTED)
+        for ext in ('c', 'cc', 'cpp', 'java', 'kt', 'py2', 'py3'):
+            pzip.writestr(f'limits/{ext}', LIMITS)
+        for name, (data, answer) in zip(names, tests):
+            pzip.writestr(f'input/{name}', data)
+            pzip.writestr(f'output/{name}', answer)
+
+
+FORMATS = {'Polygon': polygon, 'BOCA': boca}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('format', choices=FORMATS)
+    parser.add_argument('output_dir')
+    parser.add_argument('-t', '--tests', type=int, default=10,
+                        dest='num_tests', help='Number of tests (default 10)')
+    parser.add_argument('-s', '--test-size', type=int, default=1,
+                        dest='test_KB', help='Size of each test, in KB'
+                        ' (default 1)')
+    parser.add_argument('-i', '--images', type=int, default=0,
+                        dest='num_images', help='Number of images (default 0)')
+    parser.add_argument('--image-size', type=int, default=64,
+                        dest='image_KB', help='Size of each image, in KB'
+                        ' (default 64)')
+    parser.add_argument('-l', '--statement-size', type=int, default=2,
+                        dest='statement_KB', help='Length of the statement,'
+                        ' in KB (default 2)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = vars(parser.parse_args())
+
+    write = FORMATS[args.pop('format')]
+    output_dir = args.pop('output_dir')
+    path = os.path.join(output_dir, f'{problem_id(**args)}.zip')
+    write(path, **args)
+    print(f'Created {path}.')
+
+
+if __name__ == '__main__':
+    main()
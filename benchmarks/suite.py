@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Measures how the readers and writers scale, on synthetic problems.
+
+For each scenario (see SCENARIOS), a Polygon and a BOCA package are generated
+(see generate.py) and the time to read them, to write them as BOCA and as
+CodeRunner, and to convert them (read and write) is measured, as the best of
+a few runs. The peak memory allocated by Python during the conversion is also
+measured (on a separate run, since tracing allocations slows everything down).
+
+The results are compared against the ones stored in a baselines file (see
+--save), showing the change for each measure. Baselines depend on the
+machine, so they should be saved and compared on the same one. Usage:
+
+    python3 benchmarks/suite.py [SCENARIO ...] [--save] [--repeat N]
+
+PDFs are only created with --pdf (if pdflatex is available). Checkers are
+compiled on an untimed warm-up run and then cached, as in a batch conversion
+(without g++, Polygon to BOCA is not measured).
+"""
+
+from argparse import ArgumentParser
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'convert_ej'))
+import generate  # noqa: E402
+import readers  # noqa: E402
+import tex  # noqa: E402
+import writers  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# Name and arguments of generate.contents for each scenario.
+SCENARIOS = {
+    'small': {'num_tests': 10},
+    'many-tests': {'num_tests': 2000},
+    'large-tests': {'num_tests': 20, 'test_KB': 2048},
+    'images': {'num_tests': 10, 'num_images': 20, 'image_KB': 128},
+    'long-statement': {'num_tests': 10, 'statement_KB': 512},
+}
+READERS = {'Polygon': readers.Polygon, 'BOCA': readers.BOCA}
+
+
+class Benchmark():
+    """Runs the measures of a scenario in a temporary directory."""
+
+    def __init__(self, tmp_dir, pdf=False):
+        """Class constructor.
+
+        Keyword arguments:
+        tmp_dir -- the directory for the packages, outputs and caches
+        pdf -- boolean to create (or not) the PDFs of BOCA problems
+        """
+        self.tmp_dir = tmp_dir
+        self.cache_dir = os.path.join(tmp_dir, 'cache')
+        self.pdf = pdf
+
+    def _output_dir(self):
+        output_dir = os.path.join(self.tmp_dir, 'output')
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.mkdir(output_dir)
+        return output_dir
+
+    def read(self, reader, package):
+        """Read the package, with a reader of the given format."""
+        return READERS[reader]().read(package)
+
+    def write(self, writer, ejproblem):
+        """Write the problem in the given format."""
+        # Nothing converted by a previous run may be reused (except the
+        # compiled checker).
+        tex.cached_to_html.cache_clear()
+        shutil.rmtree(os.path.join(self.cache_dir, 'pdfs'), ignore_errors=True)
+        if writer == 'BOCA':
+            return writers.BOCA().write(ejproblem, self._output_dir(),
+                                        self.tmp_dir, cache_dir=self.cache_dir,
+                                        pdf=self.pdf)
+        return writers.CodeRunner().write(ejproblem, self._output_dir())
+
+    def convert(self, reader, writer, package):
+        """Read the package and write it in the given format."""
+        with self.read(reader, package) as ejproblem:
+            return self.write(writer, ejproblem)
+
+    def run(self, scenario, repeat=3):
+        """Return the measures (in seconds and MB) of the given scenario."""
+        def best(function, *args):
+            elapsed = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function(*args)
+                elapsed = min(elapsed, time.perf_counter() - start)
+            return elapsed
+
+        def peak_MB(function, *args):
+            tracemalloc.start()
+            try:
+                function(*args)
+                return tracemalloc.get_traced_memory()[1] / 2 ** 20
+            finally:
+                tracemalloc.stop()
+
+        results = {}
+        for reader, generate_package in (('Polygon', generate.polygon),
+                                         ('BOCA', generate.boca)):
+            package = os.path.join(self.tmp_dir, f'{reader}.zip')
+            generate_package(package, **SCENARIOS[scenario])
+            results[f'read {reader}'] = best(
+                lambda: self.read(reader, package).close())
+
+            with self.read(reader, package) as ejproblem:
+                for writer in ('BOCA', 'CodeRunner'):
+                    if reader == writer or (
+                            writer == 'BOCA' and
+                            ejproblem.evaluation.checker and
+                            shutil.which('g++') is None):
+                        continue  # Unable to compile the checker.
+                    self.write(writer, ejproblem)  # Warm-up.
+                    key = f'{reader} to {writer}'
+                    results[f'write {key}'] = best(self.write, writer,
+                                                   ejproblem)
+                    results[f'convert {key}'] = best(self.convert, reader,
+                                                     writer, package)
+                    results[f'peak MB {key}'] = peak_MB(self.convert, reader,
+                                                        writer, package)
+        return results
+
+
+def compare(results, baselines, tolerance):
+    """Print the results along with the baselines, returning the number of
+    measures that got worse by more than tolerance (a fraction)."""
+    worse = 0
+    for scenario, measures in results.items():
+        print(f'\n{scenario}')
+        for measure, value in measures.items():
+            baseline = baselines.get(scenario, {}).get(measure)
+            unit = 'MB' if measure.startswith('peak') else 's'
+            line = f'  {measure:<32} {value:>10.4f} {unit:<2}'
+            if baseline:
+                change = value / baseline - 1
+                line += f' {change:>+8.1%} (baseline {baseline:.4f})'
+                if change > tolerance:
+                    line += ' WORSE'
+                    worse += 1
+            print(line)
+    return worse
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS),
+                        metavar='SCENARIO',
+                        help=f'Scenarios to run ({", ".join(SCENARIOS)})')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Best of this many runs (default 3)')
+    parser.add_argument('-b', '--baselines', default=BASELINES,
+                        help='File with the baselines (default'
+                        ' %(default)s)')
+    parser.add_argument('--save', action='store_true',
+                        help='Store the results as the new baselines')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fraction a measure may get worse before it is'
+                        ' reported (default 0.2)')
+    parser.add_argument('--pdf', action='store_true',
+                        help='Create the PDFs of BOCA problems (requires'
+                        ' pdflatex)')
+    args = parser.parse_args()
+    if unknown := set(args.scenarios) - set(SCENARIOS):
+        parser.error(f'unknown scenario(s): {", ".join(sorted(unknown))}')
+
+    pdf = args.pdf and shutil.which('pdflatex') is not None
+    if args.pdf and not pdf:
+        print('pdflatex not found, PDFs are not created.')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmark = Benchmark(tmp_dir, pdf)
+        for scenario in args.scenarios:
+            print(f'Running {scenario}...', file=sys.stderr)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[scenario] = benchmark.run(scenario, args.repeat)
+
+    try:
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    worse = compare(results, baselines, args.tolerance)
+
+    if args.save:
+        baselines.update(results)
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f'\nBaselines saved to {args.baselines}.')
+    elif worse:
+        print(f'\n{worse} measure(s) worse than the baselines.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
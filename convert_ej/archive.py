@@ -0,0 +1,251 @@
+import collections
+import mmap
+import os
+import posixpath
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+try:
+    # works for using pypi or command line
+    import profiling
+except Exception:
+    from . import profiling
+
+
+class ZipArchive():
+    """Gives access to the members of a zip file.
+
+    The file is kept open for as long as the archive is in use, so its members
+    can be read on demand (after the problem itself has been read). It is also
+    memory mapped, so stored (uncompressed) members are read with no copies.
+    """
+
+    def __init__(self, file):
+        """Class constructor.
+
+        Keyword arguments:
+        file -- the path of the zip file
+        """
+        self.file = file
+        self.pzip = zipfile.ZipFile(file)
+        self.lock = threading.Lock()
+        self.map = None
+
+        # The files in each directory, so they can be listed without going
+        # through all the members.
+        self.dirs = {}
+        for info in self.pzip.infolist():
+            if not info.is_dir():
+                dir_path = posixpath.dirname(info.filename)
+                self.dirs.setdefault(dir_path, []).append(info.filename)
+
+    def _read_raw(self, info):
+        """Return the (compressed) data of the given member, as stored.
+
+        The data is a memoryview of the mapped file, so nothing is copied.
+        """
+        with self.lock:
+            if self.map is None:
+                with open(self.file, 'rb') as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        name_len, extra_len = struct.unpack_from('<HH', self.map,
+                                                 info.header_offset + 26)
+        start = info.header_offset + zipfile.sizeFileHeader + name_len + \
+            extra_len
+        profiling.count(info.compress_size)
+        return memoryview(self.map)[start:start + info.compress_size]
+
+    def check(self, name):
+        """Raise ValueError if the given member is not in the archive."""
+        try:
+            self.pzip.getinfo(name)
+        except KeyError as e:
+            raise ValueError(e)
+
+    def close(self):
+        """Close the underlying zip file."""
+        self.pzip.close()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                # Some member is still in use, the map is closed once it is
+                # no longer referenced.
+                pass
+            self.map = None
+
+    def copy(self, name, pzip, arcname, compress_type=None,
+             compresslevel=None, recompress=False):
+        """Copy the given member into the open zip file pzip as arcname.
+
+        Members already compressed with compress_type (pzip's, if None) are
+        copied as they are, with no decompression/compression cycle, unless
+        recompress is set. Other members are decompressed and compressed again
+        with compress_type and compresslevel.
+        """
+        if compress_type is None:
+            compress_type = pzip.compression
+            compresslevel = pzip.compresslevel
+        write_raw(pzip, *self.member(name, arcname, compress_type,
+                                     compresslevel, recompress))
+
+    def member(self, name, arcname, compress_type, compresslevel=None,
+               recompress=False):
+        """Return the ZipInfo and data of the given member as arcname, ready to
+        be written by write_raw (see copy).
+
+        Since it only reads the archive, it can be run in parallel.
+        """
+        try:
+            info = self.pzip.getinfo(name)
+        except KeyError as e:
+            raise ValueError(e)
+
+        if (recompress or info.flag_bits & 0x1 or
+                info.compress_type != compress_type or
+                compress_type not in (zipfile.ZIP_STORED,
+                                      zipfile.ZIP_DEFLATED)):
+            return compress(arcname, self.read(name), compress_type,
+                            compresslevel)
+
+        zinfo = _zinfo(arcname, info.compress_type, info.CRC,
+                       info.compress_size, info.file_size,
+                       info.flag_bits & 0x6)  # deflate options only
+        return zinfo, self._read_raw(info)
+
+    def list_dir(self, path, recursive=False):
+        """Return the names of the files in the given directory (and in its
+        subdirectories, if recursive)."""
+        path = path.rstrip('/')
+        if not recursive:
+            return list(self.dirs.get(path, []))
+
+        prefix = f'{path}/'
+        return [name
+                for dir_path, names in self.dirs.items()
+                if dir_path == path or dir_path.startswith(prefix)
+                for name in names]
+
+    def read(self, name):
+        """Return the bytes of the given member.
+
+        Stored members are returned as a memoryview of the mapped file (with no
+        copies), the others are decompressed into a new bytes object.
+        """
+        try:
+            info = self.pzip.getinfo(name)
+        except KeyError as e:
+            raise ValueError(e)
+
+        if (info.compress_type == zipfile.ZIP_STORED and
+                not info.flag_bits & 0x1):
+            return self._read_raw(info)
+        with self.lock:
+            data = self.pzip.read(info)
+        profiling.count(len(data))
+        return data
+
+
+def _zinfo(arcname, compress_type, crc, compress_size, file_size,
+           flag_bits=0):
+    """Return the ZipInfo of a member created now."""
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(time.time())[:6])
+    zinfo.compress_type = compress_type
+    zinfo.flag_bits = flag_bits
+    zinfo.CRC = crc
+    zinfo.compress_size = compress_size
+    zinfo.file_size = file_size
+    zinfo.external_attr = 0o600 << 16
+    return zinfo
+
+
+def compress(arcname, data, compress_type, compresslevel=None):
+    """Return the ZipInfo and compressed data of a member arcname with the
+    given data, ready to be written by write_raw.
+
+    Since it does not touch any zip file, it can be run in parallel (zlib
+    releases the GIL while compressing).
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    # Same compressors (and options) as zipfile's.
+    compressor = zipfile._get_compressor(compress_type, compresslevel)
+    if compressor is None:
+        compressed = data
+    else:
+        compressed = compressor.compress(data) + compressor.flush()
+    flag_bits = 0x2 if compress_type == zipfile.ZIP_LZMA else 0
+    return _zinfo(arcname, compress_type, zlib.crc32(data), len(compressed),
+                  len(data), flag_bits), compressed
+
+
+def write_all(pzip, members, threads=None):
+    """Write members to the open zip file pzip, in the given order.
+
+    Each member is a function returning its ZipInfo and data (as compress and
+    ZipArchive.member do), run in a pool of threads (or sequentially, if
+    threads is 1) while the results are written.
+    """
+    if threads == 1:
+        for member in members:
+            write_raw(pzip, *member())
+        return
+
+    import concurrent.futures
+
+    threads = threads or os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        # Only a few members ahead, so they are not all kept in memory.
+        pending = collections.deque()
+        for member in members:
+            # Measured (when profiling) as part of the current phase.
+            pending.append(executor.submit(profiling.propagate(member)))
+            if len(pending) > 2 * threads:
+                write_raw(pzip, *pending.popleft().result())
+        while pending:
+            write_raw(pzip, *pending.popleft().result())
+
+
+def write_copies(pzip, arcnames, data, compress_type=None, compresslevel=None):
+    """Write data to the open zip file pzip once for each of arcnames.
+
+    The data is compressed only once (with compress_type and compresslevel,
+    or pzip's, if None), instead of once per member as with writestr.
+    """
+    if compress_type is None:
+        compress_type = pzip.compression
+        compresslevel = pzip.compresslevel
+    zinfo, compressed = compress(arcnames[0], data, compress_type,
+                                 compresslevel)
+    for arcname in arcnames:
+        write_raw(pzip, _zinfo(arcname, zinfo.compress_type, zinfo.CRC,
+                               zinfo.compress_size, zinfo.file_size,
+                               zinfo.flag_bits), compressed)
+
+
+def write_raw(pzip, zinfo, data):
+    """Write a member to the open zip file pzip with data already compressed.
+
+    The zinfo must describe data (compress_type, CRC, compress_size and
+    file_size). Since zipfile has no public API for this, it follows what
+    ZipFile.writestr does, minus the compression.
+    """
+    if pzip._writing:
+        raise ValueError("Can't write to the ZIP file while there is an "
+                         "open writing handle on it.")
+
+    with pzip._lock:
+        if pzip._seekable:
+            pzip.fp.seek(pzip.start_dir)
+        zinfo.header_offset = pzip.fp.tell()
+        pzip._writecheck(zinfo)
+        pzip._didModify = True
+        pzip.fp.write(zinfo.FileHeader())
+        pzip.fp.write(data)
+        pzip.filelist.append(zinfo)
+        pzip.NameToInfo[zinfo.filename] = zinfo
+        pzip.start_dir = pzip.fp.tell()
+    profiling.count(zinfo.file_size)
@@ -0,0 +1,107 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import copy
+import functools
+import os
+import subprocess
+
+try:
+    # works for using pypi or command line
+    import tools
+except Exception:
+    from . import tools
+
+
+class AsyncRunner():
+    """Runs tools as subprocesses of an asyncio event loop, with a limit on
+    how many runs of each tool are at the same time."""
+
+    def __init__(self, loop, limits=None):
+        """Class constructor.
+
+        Keyword arguments:
+        loop -- the (running) event loop
+        limits -- dict with the limit of runs of each tool, updating
+                  tools.LIMITS
+        """
+        self.loop = loop
+        self.limits = {**tools.LIMITS, **(limits or {})}
+        self.semaphores = {}
+
+    async def run(self, cmd, cwd=None, capture=False):
+        """Run the given command (a list) in cwd, once its tool is under its
+        limit, returning its output if capture is True.
+
+        Raises subprocess.CalledProcessError if the command fails.
+        """
+        tool = os.path.basename(cmd[0])
+        if tool not in self.semaphores:
+            self.semaphores[tool] = asyncio.Semaphore(
+                tools.limit(tool, self.limits))
+
+        async with self.semaphores[tool]:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, cwd=cwd,
+                stdout=subprocess.PIPE if capture else subprocess.DEVNULL)
+            stdout, _ = await process.communicate()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, cmd,
+                                                stdout)
+        return stdout
+
+    def call(self, cmd, cwd=None, capture=False):
+        """Run the given command (see run) from another thread than the event
+        loop's, blocking it until the command is done."""
+        return asyncio.run_coroutine_threadsafe(
+            self.run(cmd, cwd, capture), self.loop).result()
+
+
+async def convert_async(reader, writer, paths, read_options=None,
+                        write_options=None, jobs=None, limits=None):
+    """Convert the files at the given paths concurrently.
+
+    Each file is read and written in a thread (at most jobs at the same time,
+    by default a few more than the number of CPUs), while the external tools
+    (such as g++ and pdflatex) run as asyncio subprocesses, limited per tool
+    (see AsyncRunner). So the Python work of some problems overlaps with the
+    tools run for others, without running too many memory hungry tools.
+
+    For example:
+
+        results = asyncio.run(convert_async(
+            readers.Polygon(), writers.BOCA(), paths,
+            write_options={'output_dir': 'boca', 'pdf': False}))
+
+    Keyword arguments:
+    reader -- the reader, such as readers.Polygon()
+    writer -- the writer, such as writers.BOCA()
+    paths -- the files to convert
+    read_options -- dict with the arguments to reader.read (besides the file)
+    write_options -- dict with the arguments to writer.write (besides the
+    problem)
+    jobs -- the number of files converted at the same time
+    limits -- dict with the number of runs of each tool at the same time,
+    updating tools.LIMITS
+
+    Returns, for each path, the list of files created or the exception
+    raised when converting it.
+    """
+    def convert(path):
+        # Readers/writers keep the state of the conversion, so each one needs
+        # its own.
+        with copy.copy(reader).read(path, **(read_options or {})) as problem:
+            return copy.copy(writer).write(problem, **(write_options or {}))
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(jobs)
+    try:
+        with tools.runner(AsyncRunner(loop, limits)):
+            # The threads call the runner through the context.
+            futures = [loop.run_in_executor(
+                executor, contextvars.copy_context().run,
+                functools.partial(convert, path)) for path in paths]
+        return await asyncio.gather(*futures, return_exceptions=True)
+    finally:
+        # Not waiting, since the threads may need the loop (if cancelled).
+        executor.shutdown(wait=False)
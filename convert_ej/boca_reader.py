@@ -0,0 +1,18 @@
+try:
+    # works for using pypi or command line
+    import formats
+    import readers
+except Exception:
+    from . import formats
+    from . import readers
+
+
+class BOCAReader(formats.Parsing, readers.BOCA):
+    """Interfaces command line parsing with a BOCA reader."""
+    def add_arguments(self, parser):
+        """Adds command line arguments for reading a problem in BOCA format."""
+        pass
+
+    def read(self, file, args):
+        """Reads the problem in the BOCA format."""
+        return super().read(file)
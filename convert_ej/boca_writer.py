@@ -0,0 +1,99 @@
+from argparse import ArgumentTypeError
+import os
+
+try:
+    # works for using pypi or command line
+    import events
+    import formats
+    import writers
+except Exception:
+    from . import events
+    from . import formats
+    from . import writers
+
+
+class BOCAWriter(formats.Parsing, writers.BOCA):
+    """Interfaces command line parsing with a BOCA writer."""
+    def add_arguments(self, parser):
+        """Adds command line arguments for writing a problem in BOCA format."""
+        def check_threads(threads):
+            """Checks the number of threads."""
+            try:
+                if (ithreads := int(threads)) > 0:
+                    return ithreads
+            except ValueError:
+                pass
+            raise ArgumentTypeError(f'{threads} is not a positive integer')
+
+        parser.add_argument('--tmp', default='/tmp', dest='tmp_dir',
+                            help='Directory for storing temporary files'
+                            ' (such as a tmpfs mount)')
+        parser.add_argument('--workspace', choices=['memory', 'disk'],
+                            default='memory',
+                            help='Keep the files for pdflatex and g++ in'
+                            ' memory until needed, or on disk (default'
+                            ' "memory")')
+        parser.add_argument('--hide-notes', action='store_false',
+                            help='Do not include the notes in the PDF')
+        parser.add_argument('--tutorial', action='store_true',
+                            help='Include the tutorial in the PDF')
+        parser.add_argument('-f', '--front', help='PDF front page')
+        parser.add_argument('--compression', default='default',
+                            choices=list(writers.BOCA.COMPRESSION),
+                            help='Compression of the zip file, images and'
+                            ' PDFs are always stored (default "default")')
+        parser.add_argument('--zip-threads', type=check_threads,
+                            help='Number of threads compressing the zip file'
+                            ' (default one per CPU)')
+        self.add_cache_arguments(parser)
+        parser.add_argument('--contest', nargs='?', const='contest',
+                            metavar='NAME',
+                            help='Create the PDFs of all problems in a single'
+                            ' pdflatex run, along with\nthe contest\'s PDF'
+                            ' NAME.pdf (default "contest")')
+
+    def whole_batch(self, args):
+        """All problems are typeset together in contest mode."""
+        return bool(args.contest)
+
+    def finish(self, args, outputs):
+        """Creates the PDFs in contest mode, returning the contest's PDF."""
+        if not args.contest:
+            return []
+        problem_zips = [(index, files[0])
+                        for index, files in enumerate(outputs) if files]
+        if not problem_zips:
+            return []
+
+        print(f'Processing contest "{args.contest}".')
+        events.emit('processing', contest=args.contest)
+        try:
+            return [self.write_contest(problem_zips, args.output_dir,
+                                       args.tmp_dir, not args.hide_notes,
+                                       args.tutorial, args.front,
+                                       args.contest)]
+        except ValueError as e:
+            error = f'{e}'
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        print(f'\tError: {error}.')
+        print(f'\tFAILED to process contest "{args.contest}".\n')
+        events.emit('failed', contest=args.contest, error=error)
+        return None
+
+    def option_files(self, args):
+        """The front page is part of every PDF."""
+        if not args.front:
+            return []
+        # Relative to the writer's module, as in write.
+        self._set_templates()
+        return [os.path.join(self.module_dir, args.front)]
+
+    def write(self, ejproblem, args):
+        """Writes the problem in the BOCA format."""
+        return super().write(ejproblem, args.output_dir, args.tmp_dir,
+                             not args.hide_notes, args.tutorial, args.front,
+                             args.index,
+                             self._cache_dir(args), args.cache_MB,
+                             not args.contest, args.compression,
+                             args.zip_threads, args.workspace == 'memory')
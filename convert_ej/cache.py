@@ -0,0 +1,98 @@
+import hashlib
+import os
+import tempfile
+
+
+def default_dir():
+    """Return the default directory for caching files."""
+    root = (os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'convert-ej')
+
+
+def hash_key(*parts):
+    """Return a key identifying the given parts (str or bytes-like objects)."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # The length avoids collisions such as ('ab', 'c') and ('a', 'bc').
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+def hash_file(path, buffer_size=2 ** 20):
+    """Return a key identifying the contents of the given file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(buffer_size):
+            h.update(data)
+    return h.hexdigest()
+
+
+class Cache():
+    """Stores files in a directory, indexed by a key.
+
+    Keys are usually a hash of whatever was used to create the file, so a
+    cached file is valid for as long as it exists. When the files in the
+    directory add up to more than max_MB, the least recently used ones are
+    removed.
+    """
+
+    def __init__(self, directory, max_MB=256):
+        """Class constructor.
+
+        Keyword arguments:
+        directory -- where the files are stored (created if necessary)
+        max_MB -- size limit for the files in the directory
+        """
+        self.directory = directory
+        self.max_size = max_MB * 2 ** 20
+        os.makedirs(directory, exist_ok=True)
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if not e.is_file() or e.name[0] == '.':
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue  # Removed by a concurrent process.
+                entries.append((st.st_mtime, st.st_size, e.path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Removed by a concurrent process.
+            size -= entry_size
+
+    def get(self, key):
+        """Return the bytes stored for key, or None if there are none."""
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used.
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        """Store data (bytes) for key."""
+        # Written to a temporary file first, so no one reads it partially.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.directory, key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._evict()
@@ -0,0 +1,56 @@
+from argparse import ArgumentTypeError
+
+try:
+    # works for using pypi or command line
+    import formats
+    import writers
+except Exception:
+    from . import formats
+    from . import writers
+
+
+class CodeRunnerWriter(formats.Parsing, writers.CodeRunner):
+    """Interfaces command line parsing with a CodeRunnerWriter writer."""
+    def __init__(self, parser):
+        """Constructor."""
+        formats.Parsing.__init__(self, parser)
+        writers.CodeRunner.__init__(self)
+
+    def add_arguments(self, parser):
+        """Adds command line arguments for writing a problem in CodeRunner format."""
+        def check_penalty(penalty):
+            """Checks the penalty value."""
+            ipenalty = int(penalty)
+            if ipenalty < 0:
+                raise ArgumentTypeError(f'Penalty "{penalty}" cannot be negative')
+            return ipenalty
+
+        parser.add_argument('-p', '--penalty',
+                            type=check_penalty,
+                            default=2,
+                            help='Number of attempts without penalty'
+                            ' (default 2)')
+
+        parser.add_argument('-aon', '--all-or-nothing',
+                            action='store_true',
+                            dest='all_or_nothing',
+                            help='Set all-or-nothing marking behavior')
+
+        languages = sorted(list(writers.CodeRunner.FILES['source'].keys()))
+        parser.add_argument('-al', '--answer-language',
+                            dest='answer_language',
+                            choices=languages,
+                            default='all',
+                            help='Set programming language for answer(s)')
+
+        self.add_cache_arguments(parser)
+
+    def write(self, ejproblem, args):
+        """Writes the problem in the CodeRunner format."""
+        return super().write(ejproblem,
+                             output_dir=args.output_dir,
+                             src_lang=args.answer_language,
+                             all_or_nothing=args.all_or_nothing,
+                             penalty_after=args.penalty,
+                             cache_dir=self._cache_dir(args),
+                             cache_MB=args.cache_MB)
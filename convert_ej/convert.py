@@ -1,19 +1,60 @@
 #!/usr/bin/env python3
 
 
-from abc import ABC, abstractmethod
 from argparse import ArgumentParser, RawTextHelpFormatter, ArgumentTypeError
-import inspect
+import contextlib
+import contextvars
+import copy
+import importlib
+import io
+import json
 import os
+import signal
 import sys
+import threading
+import time
 
 try:
     # works for using pypi or command line
-    import readers
-    import writers
+    import cache
+    import events
+    import manifest
+    import profiling
 except Exception:
-    from . import readers
-    from . import writers
+    from . import cache
+    from . import events
+    from . import manifest
+    from . import profiling
+
+# Options that do not change the files created, so they are not part of the
+# manifest's fingerprint (the reader and writer are added by name).
+RUN_OPTIONS = ('files', 'output_dir', 'jobs', 'threads', 'manifest', 'force',
+               'watch', 'profile', 'events', 'reader', 'writer', 'tmp_dir',
+               'workspace', 'zip_threads', 'cache_dir', 'cache_MB',
+               'no_cache')
+
+# Formats on the command line and the (module, class) implementing each one,
+# only imported (along with the reader or writer it adapts) once the formats
+# are parsed (see load_format). The common options are in formats.Parsing.
+READERS = {'BOCA': ('boca_reader', 'BOCAReader'),
+           'Polygon': ('polygon_reader', 'PolygonReader')}
+WRITERS = {'BOCA': ('boca_writer', 'BOCAWriter'),
+           'CodeRunner': ('coderunner_writer', 'CodeRunnerWriter')}
+
+def load_format(formats, name):
+    """Import and return the class of the format with the given name.
+
+    Keyword arguments:
+    formats -- READERS or WRITERS
+    name -- the name of the format, as on the command line
+    """
+    module, cls = formats[name]
+    try:
+        # works for using pypi or command line
+        module = importlib.import_module(module)
+    except Exception:
+        module = importlib.import_module(f'.{module}', __package__)
+    return getattr(module, cls)
 
 
 class EJudgeParser(ArgumentParser):
@@ -31,31 +72,57 @@ class EJudgeParser(ArgumentParser):
                          add_help=False,
                          formatter_class=RawTextHelpFormatter)
 
-        self.add_argument('reader', choices=self._list_formats('readers'),
+        self.add_argument('reader', choices=READERS,
                           help='Input e-judge format')
-        self.add_argument('writer', choices=self._list_formats('writers'),
+        self.add_argument('writer', choices=WRITERS,
                           help='Output e-judge format')
-        self.add_argument('files', type=self._check_file, nargs='+',
+        self.add_argument('files', nargs='+',
                           help='Path of a file or folder of files to convert'
-                          ' from reader to writer formats')
+                          ' from reader to writer formats\n(zip files in'
+                          ' folders are found recursively)')
         self.add_argument('-o', '--output_dir', type=self._check_dir,
                           default='./',
                           help='Path of folder to save converted file(s)')
+        self.add_argument('-j', '--jobs', type=self._check_jobs, default=1,
+                          help='Number of files to convert in parallel'
+                          ' (default 1)')
+        self.add_argument('--threads', action='store_true',
+                          help='Convert files in parallel using threads'
+                          ' instead of processes')
+        self.add_argument('--manifest', action='store_true',
+                          help='Skip files converted before with the same'
+                          ' contents and options, as\nrecorded in'
+                          f' {manifest.Manifest.FILE} (in the output'
+                          ' folder)')
+        self.add_argument('--force', action='store_true',
+                          help='Convert all files, even if unchanged'
+                          ' according to the manifest')
+        self.add_argument('--watch', nargs='?', type=self._check_interval,
+                          const=1.0, metavar='SECONDS',
+                          help='Keep running, converting the files again'
+                          ' whenever they change (checked\nevery SECONDS,'
+                          ' default 1)')
+        self.add_argument('--profile', nargs='?', type=self._check_dir,
+                          const=True, metavar='DIR',
+                          help='Record the time and bytes processed by each'
+                          ' step of the conversions,\nsaved as JSON in DIR'
+                          ' (default the output folder)')
+        self.add_argument('--events', nargs='?', const='-', metavar='FILE',
+                          help='Report the progress as JSON lines (one'
+                          ' event per line), appended to\nFILE (default'
+                          ' stderr)')
 
         # Anything different than basic arguments is considered an error and
-        # triggers the "help" message.
+        # triggers the "help" message. The files are only checked once all
+        # arguments are parsed (see parse_known_args).
         args, unknown = super().parse_known_args()
 
         if args.reader == args.writer:
             exit(0)
 
         # Add specific arguments.
-        curr_module = sys.modules[__name__]
-        reader_class = getattr(curr_module, f'{args.reader}Reader')
-        writer_class = getattr(curr_module, f'{args.writer}Writer')
-
-        self.reader = reader_class(self)
-        self.writer = writer_class(self)
+        self.reader = load_format(READERS, args.reader)(self)
+        self.writer = load_format(WRITERS, args.writer)(self)
 
         # All arguments set, add "help" option.
         self.add_argument('-h', '--help', action='help',
@@ -67,20 +134,29 @@ class EJudgeParser(ArgumentParser):
             return path
         raise ArgumentTypeError(f'{path} is not a directory')
 
+    def _check_jobs(self, jobs):
+        """Check if the given number of jobs is positive."""
+        try:
+            if (ijobs := int(jobs)) > 0:
+                return ijobs
+        except ValueError:
+            pass
+        raise ArgumentTypeError(f'{jobs} is not a positive integer')
+
     def _check_file(self, path):
-        """Check if the given path is a file."""
-        if os.path.isfile(path):
+        """Check if the given path is a file or a directory."""
+        if os.path.isfile(path) or os.path.isdir(path):
             return path
-        raise ArgumentTypeError(f'{path} is not a file')
+        raise ArgumentTypeError(f'{path} is not a file or directory')
 
-    def _list_formats(self, module):
-        """Return a list of names of classes that can be instantiated from the
-        given module."""
-        curr = sys.modules[__name__]
-        return sorted([m[0]
-                       for m in inspect.getmembers(getattr(curr, module),
-                                                   inspect.isclass)
-                       if not inspect.isabstract(m[1]) and m[0] != 'ABC'])
+    def _check_interval(self, seconds):
+        """Check if the given number of seconds is positive."""
+        try:
+            if (fseconds := float(seconds)) > 0:
+                return fseconds
+        except ValueError:
+            pass
+        raise ArgumentTypeError(f'{seconds} is not a positive number')
 
     def error(self, message):
         """Show "help" on error, if given as argument."""
@@ -90,139 +166,357 @@ class EJudgeParser(ArgumentParser):
 
         super().error(message)
 
-    def parse_args(self, args=None, namespace=None):
-        """Overrides parse_args to add class instances to args."""
-        args = super().parse_args(args, namespace)
-        args.reader = self.reader
-        args.writer = self.writer
-        return args
-
     def parse_known_args(self, args=None, namespace=None):
-        """Overrides parse_known_args to add class instances to args."""
+        """Overrides parse_known_args to check the files and add class
+        instances to args."""
         args, unknown = super().parse_known_args(args, namespace)
+        for file in args.files:
+            try:
+                self._check_file(file)
+            except ArgumentTypeError as e:
+                self.error(f'argument files: {e}')
         args.reader = self.reader
         args.writer = self.writer
         return args, unknown
 
 
-class Parsing(ABC):
-    """Adds arguments for command line parsing."""
-    def __init__(self, parser):
-        """Creates the instance and adds arguments to the given parser."""
-        self.add_arguments(parser)
-
-    @abstractmethod
-    def add_arguments(parser):
-        """Adds arguments for command line parsing to the given parser."""
-        pass
-
-
-###############################################################################
-class BOCAReader(Parsing, readers.BOCA):
-    """Interfaces command line parsing with a BOCA reader."""
-    def add_arguments(self, parser):
-        """Adds command line arguments for reading a problem in BOCA format."""
-        pass
-
-    def read(self, file, args):
-        """Reads the problem in the BOCA format."""
-        return super().read(file)
-
-
-class BOCAWriter(Parsing, writers.BOCA):
-    """Interfaces command line parsing with a BOCA writer."""
-    def add_arguments(self, parser):
-        """Adds command line arguments for writing a problem in BOCA format."""
-        parser.add_argument('--tmp', default='/tmp', dest='tmp_dir',
-                            help='Directory for storing temporary files')
-        parser.add_argument('--hide-notes', action='store_false',
-                            help='Do not include the notes in the PDF')
-        parser.add_argument('--tutorial', action='store_true',
-                            help='Include the tutorial in the PDF')
-        parser.add_argument('-f', '--front', help='PDF front page')
-
-    def write(self, ejproblem, args):
-        """Writes the problem in the BOCA format."""
-        super().write(ejproblem, args.output_dir, args.tmp_dir,
-                      not args.hide_notes, args.tutorial, args.front, args.index)
-
-
 ###############################################################################
-class CodeRunnerWriter(Parsing, writers.CodeRunner):
-    """Interfaces command line parsing with a CodeRunnerWriter writer."""
-    def __init__(self, parser):
-        """Constructor."""
-        Parsing.__init__(self, parser)
-        writers.CodeRunner.__init__(self)
-
-    def add_arguments(self, parser):
-        """Adds command line arguments for writing a problem in CodeRunner format."""
-        def check_penalty(penalty):
-            """Checks the penalty value."""
-            ipenalty = int(penalty)
-            if ipenalty < 0:
-                raise ArgumentTypeError(f'Penalty "{penalty}" cannot be negative')
-            return ipenalty
-
-        parser.add_argument('-p', '--penalty',
-                            type=check_penalty,
-                            default=2,
-                            help='Number of attempts without penalty'
-                            ' (default 2)')
-
-        parser.add_argument('-aon', '--all-or-nothing',
-                            action='store_true',
-                            dest='all_or_nothing',
-                            help='Set all-or-nothing marking behavior')
-
-        languages = sorted(list(writers.CodeRunner.FILES['source'].keys()))
-        parser.add_argument('-al', '--answer-language',
-                            dest='answer_language',
-                            choices=languages,
-                            default='all',
-                            help='Set programming language for answer(s)')
-
-    def write(self, ejproblem, args):
-        """Writes the problem in the CodeRunner format."""
-        super().write(ejproblem,
-                      output_dir=args.output_dir,
-                      src_lang=args.answer_language,
-                      all_or_nothing=args.all_or_nothing,
-                      penalty_after=args.penalty)
-
-
-###############################################################################
-class PolygonReader(Parsing, readers.Polygon):
-    """Interfaces command line parsing with a PolygonReader reader."""
-    def add_arguments(self, parser):
-        """Adds command line arguments for reading a problem in Polygon format."""
-        parser.add_argument('-sl', '--statement-language',
-                            dest='stmt_lang',
-                            default='english',
-                            help='Set statement language')
-
-    def read(self, file, args):
-        """Reads the problem in the Polygon format."""
-        return super().read(file, args.stmt_lang)
+# What is printed in the context of capture (None if printed as usual).
+_printed = contextvars.ContextVar('printed', default=None)
+_stdout_lock = threading.Lock()
+
+
+class Output(io.TextIOBase):
+    """Stands for sys.stdout, keeping what is printed in the context of
+    capture apart from the rest."""
+
+    def __init__(self, stdout):
+        """Class constructor.
+
+        Keyword arguments:
+        stdout -- the (text) file object to write to when not capturing
+        """
+        self.stdout = stdout
+
+    def write(self, text):
+        """Write the given text, or keep it if capturing."""
+        if (printed := _printed.get()) is not None:
+            printed.append(text)
+            return len(text)
+        return self.stdout.write(text)
+
+    def flush(self):
+        """Flush the file object written to when not capturing."""
+        self.stdout.flush()
+
+
+@contextlib.contextmanager
+def capture():
+    """Keep what is printed in the context (including other threads, see
+    profiling.propagate) instead of printing it, yielding the list of the
+    strings printed."""
+    with _stdout_lock:
+        if not isinstance(sys.stdout, Output):
+            sys.stdout = Output(sys.stdout)
+    printed = []
+    token = _printed.set(printed)
+    try:
+        yield printed
+    finally:
+        _printed.reset(token)
+
+
+def convert(args, index, file, captured=False):
+    """Converts a single file.
+
+    The index is the position of the file in the batch, used by writers that
+    number the problems (such as the BOCA PDF). If captured, what would be
+    printed is returned instead (see capture), so conversions in parallel
+    are shown in order.
+
+    Returns the list of files created, an error message (None if
+    successful), the phases measured (None if not profiling, see
+    profiling.Profile.to_dict), the events of the conversion (None if not
+    reporting them, see events.Recorder) and what was printed (None if not
+    captured).
+    """
+    # Readers/writers keep the state of the conversion, so each one needs its
+    # own (allowing conversions in parallel threads).
+    args = copy.copy(args)
+    args.reader = copy.copy(args.reader)
+    args.writer = copy.copy(args.writer)
+    args.index = index
+    profile = profiling.Profile() if args.profile is not None else None
+    # Events are kept and sent by the caller, so the events of conversions
+    # in parallel (even in other processes) are never interleaved.
+    recorder = (events.Recorder(file=file, index=index)
+                if args.events is not None else None)
+    created = error = printed = None
+    with contextlib.ExitStack() as stack:
+        if captured:
+            printed = stack.enter_context(capture())
+        if profile:
+            stack.enter_context(profiling.profile(profile))
+        if recorder:
+            stack.enter_context(events.record(recorder))
+
+        start = time.perf_counter()
+        try:
+            print(f'Processing "{file}".')
+            events.emit('processing')
+            with profiling.phase('read'), events.phase('read'):
+                ejproblem = args.reader.read(file, args)
+            if recorder:
+                recorder.fields['problem'] = ejproblem.id
+            with ejproblem, profiling.phase('write'), events.phase('write'):
+                created = args.writer.write(ejproblem, args)
+        except ValueError as e:
+            error = f'{e}'
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+
+        wall = time.perf_counter() - start
+        if error:
+            events.emit('failed', error=error, wall=wall)
+        else:
+            events.emit('done', outputs=created, wall=wall)
+    return (created, error, profile.to_dict() if profile else None,
+            recorder.events if recorder else None,
+            ''.join(printed) if printed is not None else None)
+
+
+def report(file, error, recorded=None, printed=None):
+    """Shows the outcome of converting a file, printing what was captured
+    and sending the events recorded during the conversion (if any)."""
+    if printed:
+        print(printed, end='')
+    if recorded:
+        events.forward(recorded)
+    if error:
+        print(f'\tError: {error}.')
+        print(f'\tFAILED to process "{file}".\n')
+
+
+def save_profiles(args, files, todo, phases, finish):
+    """Writes the phases measured for each file converted (named after its
+    index in the batch and its name, since files found in different folders
+    may have the same name) and their total (profile.json) to the profile
+    folder.
+
+    The finish phases are the ones measured after all files were converted
+    (see Parsing.finish), which are only part of the total.
+    """
+    def save(name, data):
+        with open(os.path.join(profile_dir, name), 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    profile_dir = args.output_dir if args.profile is True else args.profile
+    total = profiling.Profile()
+    for index in todo:
+        name = os.path.splitext(os.path.basename(files[index]))[0]
+        save(f'{index}-{name}.profile.json', {'file': files[index],
+                                              'phases': phases[index]})
+        total.merge(phases[index])
+    total.merge(finish)
+    save('profile.json', {'files': len(todo), 'phases': total.to_dict()})
+
+
+def options(args, index):
+    """Returns a fingerprint of the options used for converting the file at
+    the given index (see RUN_OPTIONS)."""
+    used = {key: value
+            for key, value in vars(args).items() if key not in RUN_OPTIONS}
+    used['reader'] = type(args.reader).__name__
+    used['writer'] = type(args.writer).__name__
+    used['index'] = index
+    # The contents of the files given as options, not only their paths.
+    used['option_files'] = {}
+    for path in args.reader.option_files(args) + \
+            args.writer.option_files(args):
+        try:
+            used['option_files'][path] = cache.hash_file(path)
+        except OSError:
+            used['option_files'][path] = None  # Fails when converting.
+    return manifest.fingerprint(used)
+
+
+def find_files(paths, output_dir):
+    """Returns the given files, with the directories replaced by the zip files
+    in them (and in their subdirectories, except output_dir), sorted."""
+    skip = os.path.realpath(output_dir)
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+
+        found = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs
+                       if os.path.realpath(os.path.join(root, d)) != skip]
+            found.extend(os.path.join(root, name)
+                         for name in names if name.lower().endswith('.zip'))
+        files.extend(sorted(found))
+    return files
+
+
+def outdated(args, files, build):
+    """Returns the indices of the files that must be converted, all of them
+    unless they were converted before (according to the build manifest) with
+    the same contents and options."""
+    todo = list(range(len(files)))
+    if build and not args.force:
+        todo = [index for index, file in enumerate(files)
+                if build.get(file, options(args, index)) is None]
+        if todo and args.writer.whole_batch(args):
+            todo = list(range(len(files)))
+        for index in sorted(set(range(len(files))) - set(todo)):
+            print(f'Skipping "{files[index]}" (unchanged).')
+            events.emit('skipped', file=files[index], index=index)
+    return todo
+
+
+def convert_all(args, files, todo, build=None, executor=None):
+    """Converts the files at the given indices (in parallel, if an executor
+    is given), recording them in the build manifest (if any).
+
+    Returns the list of files created for each file (None if it failed or was
+    not converted).
+    """
+    events.emit('started', files=len(files), todo=len(todo))
+    start = time.perf_counter()
+    outputs = [None] * len(files)
+    phases = [None] * len(files)
+    if executor is None:
+        for index in todo:
+            created, error, phases[index], recorded, _ = convert(
+                args, index, files[index])
+            report(files[index], error, recorded)
+            outputs[index] = created
+    else:
+        # Each file is sent to its own worker, results (including what is
+        # printed) are reported in the same order as given.
+        futures = [executor.submit(convert, args, index, files[index], True)
+                   for index in todo]
+        for index, future in zip(todo, futures):
+            created, error, phases[index], recorded, printed = \
+                future.result()
+            report(files[index], error, recorded, printed)
+            outputs[index] = created
+
+    finish = profiling.Profile()
+    batch_outputs = []
+    if todo:
+        with (profiling.profile(finish) if args.profile is not None
+              else contextlib.nullcontext()):
+            with profiling.phase('finish'):
+                batch_outputs = args.writer.finish(args, outputs)
+    if todo and args.profile is not None:
+        save_profiles(args, files, todo, phases, finish.to_dict())
+
+    if build:
+        # Recorded after finishing, which may change the files created. The
+        # files created for the whole batch are recorded along with each
+        # file's (which are converted again if finishing failed).
+        for index in todo:
+            if outputs[index] and batch_outputs is not None:
+                build.update(files[index], options(args, index),
+                             outputs[index] + batch_outputs)
+            else:
+                build.remove(files[index])
+        build.save()
+
+    converted = sum(1 for index in todo if outputs[index])
+    events.emit('finished', converted=converted,
+                failed=len(todo) - converted,
+                wall=time.perf_counter() - start)
+    return outputs
+
+
+def watch(args, outputs, build=None, executor=None):
+    """Converts the files again whenever they change (or new ones are found
+    in the directories given), until interrupted.
+
+    The outputs (files created for each file, as returned by convert_all) are
+    never taken as input, in case they are written next to the inputs.
+
+    It polls the files every args.watch seconds. A file is converted once it
+    stops changing (it may be still being written), reusing whatever was
+    loaded and cached by previous conversions.
+    """
+    def stat_all(files):
+        stats = {}
+        for file in files:
+            try:
+                st = os.stat(file)
+                stats[file] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                pass  # Removed.
+        return stats
+
+    def add_created(outputs):
+        created.update(os.path.abspath(file)
+                       for files_created in outputs if files_created
+                       for file in files_created)
+
+    created = set()
+    add_created(outputs)
+    seen = stat_all(find_files(args.files, args.output_dir))
+    previous = seen
+    print('Watching for changes (press Ctrl+C to stop).')
+    try:
+        while True:
+            time.sleep(args.watch)
+            files = [file
+                     for file in find_files(args.files, args.output_dir)
+                     if os.path.abspath(file) not in created]
+            current = stat_all(files)
+            todo = [index for index, file in enumerate(files)
+                    if file in current and current[file] != seen.get(file) and
+                    current[file] == previous.get(file)]
+            if todo and args.writer.whole_batch(args):
+                todo = list(range(len(files)))
+
+            if todo:
+                add_created(convert_all(args, files, todo, build, executor))
+                seen.update(stat_all(files[index] for index in todo))
+            previous = current
+    except KeyboardInterrupt:
+        print('Stopped watching.')
+
+
+def ignore_interrupt():
+    """Ignores Ctrl+C (SIGINT) in the current process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
 
-###############################################################################
 def main():
     parser = EJudgeParser()
     args = parser.parse_args()
 
-    for index, file in enumerate(args.files):
-        try:
-            print(f'Processing "{file}".')
-            ejproblem = args.reader.read(file, args)
-            args.index = index
-            args.writer.write(ejproblem, args)
-        except ValueError as e:
-            print(f'\tError: {e}.')
-            print(f'\tFAILED to process "{file}".\n')
-        except Exception as e:
-            raise e
-            print(e)
+    build = manifest.Manifest(args.output_dir) if args.manifest else None
+    executor = None
+    if args.jobs > 1:
+        # Only imported when needed (along with multiprocessing).
+        import concurrent.futures
+    if args.jobs > 1 and args.threads:
+        executor = concurrent.futures.ThreadPoolExecutor(args.jobs)
+    elif args.jobs > 1:
+        # When watching, Ctrl+C is meant for the main process only.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            args.jobs, initializer=ignore_interrupt if args.watch else None)
+
+    with contextlib.ExitStack() as stack:
+        if args.events is not None:
+            stack.enter_context(events.stream(args.events))
+        if executor is not None:
+            stack.callback(executor.shutdown)
+
+        files = find_files(args.files, args.output_dir)
+        outputs = convert_all(args, files, outdated(args, files, build),
+                              build, executor)
+        if args.watch:
+            watch(args, outputs, build, executor)
 
 
 if __name__ == "__main__":
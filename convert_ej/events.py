@@ -0,0 +1,96 @@
+import contextlib
+import contextvars
+import json
+import sys
+import threading
+import time
+
+
+class Recorder():
+    """Keeps the events of a conversion, adding the given fields (such as the
+    file converted) to each one, so they can be sent to a Stream later (such
+    as from another process)."""
+
+    def __init__(self, **fields):
+        """Class constructor."""
+        self.lock = threading.Lock()
+        self.fields = fields
+        self.events = []
+
+    def add(self, event):
+        """Keep the given event (a dict)."""
+        with self.lock:
+            self.events.append(event)
+
+
+class Stream():
+    """Writes events to a file as JSON lines, one event per line."""
+
+    def __init__(self, file):
+        """Class constructor.
+
+        Keyword arguments:
+        file -- the (text) file object to write to
+        """
+        self.lock = threading.Lock()
+        self.fields = {}
+        self.file = file
+
+    def add(self, event):
+        """Write the given event (a dict)."""
+        line = json.dumps(event, default=str)
+        with self.lock:
+            self.file.write(f'{line}\n')
+            self.file.flush()
+
+
+_sink = contextvars.ContextVar('events', default=None)
+
+
+def emit(event, **fields):
+    """Send an event of the given kind (such as "created" or "warning") with
+    the given fields, if recording events (see record and stream)."""
+    if (sink := _sink.get()) is not None:
+        sink.add({'time': time.time(), 'event': event, **sink.fields,
+                  **fields})
+
+
+def forward(events):
+    """Send the given events (such as those of a Recorder) as they are."""
+    if (sink := _sink.get()) is not None:
+        for event in events:
+            sink.add(event)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Send a "phase" event with the wall and CPU times (in seconds) of the
+    code run in the context, if it succeeds."""
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    yield
+    emit('phase', phase=name, wall=time.perf_counter() - wall,
+         cpu=time.thread_time() - cpu)
+
+
+@contextlib.contextmanager
+def record(sink):
+    """Send the events of whatever is run in the context (including other
+    threads, see profiling.propagate) to the given Recorder or Stream."""
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+
+@contextlib.contextmanager
+def stream(path):
+    """Write the events of whatever is run in the context as JSON lines,
+    appended to the file at path ("-" for stderr)."""
+    if path == '-':
+        with record(Stream(sys.stderr)) as sink:
+            yield sink
+    else:
+        with open(path, 'a') as f, record(Stream(f)) as sink:
+            yield sink
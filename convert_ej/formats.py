@@ -0,0 +1,54 @@
+from abc import ABC, abstractmethod
+
+try:
+    # works for using pypi or command line
+    import cache
+except Exception:
+    from . import cache
+
+
+class Parsing(ABC):
+    """Adds arguments for command line parsing."""
+    def __init__(self, parser):
+        """Creates the instance and adds arguments to the given parser."""
+        self.add_arguments(parser)
+
+    @abstractmethod
+    def add_arguments(parser):
+        """Adds arguments for command line parsing to the given parser."""
+        pass
+
+    def add_cache_arguments(self, parser):
+        """Adds command line arguments for caching files between runs."""
+        parser.add_argument('--cache-dir', default=cache.default_dir(),
+                            help='Directory for caching files between runs'
+                            ' (default %(default)s)')
+        parser.add_argument('--cache-size', type=int, default=256,
+                            dest='cache_MB',
+                            help='Size limit (in MB) for each kind of cached'
+                            ' file (default %(default)s)')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Do not use cached files')
+
+    def _cache_dir(self, args):
+        """Returns the directory for caching files, None if disabled."""
+        return None if args.no_cache else args.cache_dir
+
+    def finish(self, args, outputs):
+        """Called after all files are processed, with the list of files
+        created for each one (None if it failed or was skipped).
+
+        Returns the list of files created for the whole batch, which depend
+        on all the files processed, or None if it failed.
+        """
+        return []
+
+    def option_files(self, args):
+        """Returns the files given as options, whose contents change the files
+        created (so they are part of the build manifest's fingerprint)."""
+        return []
+
+    def whole_batch(self, args):
+        """Returns True if all files must be converted whenever any of them
+        is (such as when the files created depend on each other)."""
+        return False
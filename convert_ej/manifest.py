@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+
+try:
+    # works for using pypi or command line
+    import cache
+except Exception:
+    from . import cache
+
+
+class Manifest():
+    """Records the conversions made into an output directory, make-style.
+
+    For each input file, it keeps the hash of its contents, a fingerprint of
+    the options used and the files created (with their size and modification
+    time), so a conversion whose input, options and outputs did not change is
+    not done again.
+    """
+    FILE = 'convert-ej-manifest.json'
+    # Changes whenever the format of the file does.
+    VERSION = 1
+
+    def __init__(self, output_dir):
+        """Class constructor, reads the manifest (if any) from output_dir.
+
+        Keyword arguments:
+        output_dir -- the directory where the converted files are written
+        """
+        self.path = os.path.join(output_dir, Manifest.FILE)
+        self.entries = {}
+        self.hashes = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get('version') == Manifest.VERSION:
+                self.entries = data['entries']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass  # No (valid) manifest, everything is converted.
+
+    def _hash(self, file):
+        # Each input is hashed only once (as long as it is not modified).
+        st = os.stat(file)
+        key = (os.path.abspath(file), st.st_size, st.st_mtime_ns)
+        if key not in self.hashes:
+            self.hashes[key] = cache.hash_file(file)
+        return self.hashes[key]
+
+    def _outputs(self, outputs):
+        def stat(path):
+            st = os.stat(path)
+            return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+        return [stat(path) for path in outputs]
+
+    def get(self, file, options):
+        """Return the files created by the conversion of the given file with
+        the given options (a fingerprint, see fingerprint), or None if it must
+        be converted (again)."""
+        entry = self.entries.get(os.path.abspath(file))
+        if entry is None or entry['options'] != options:
+            return None
+
+        try:
+            if (entry['input'] != self._hash(file) or
+                    self._outputs(path for path, _, _ in entry['outputs']) !=
+                    entry['outputs']):
+                return None
+        except OSError:
+            return None  # Input or output missing.
+        return [path for path, _, _ in entry['outputs']]
+
+    def remove(self, file):
+        """Forget the conversion of the given file (such as when it fails)."""
+        self.entries.pop(os.path.abspath(file), None)
+
+    def save(self):
+        """Write the manifest to the output directory."""
+        data = {'version': Manifest.VERSION, 'entries': self.entries}
+        # Written to a temporary file first, so it is never left incomplete.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                        prefix='.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def update(self, file, options, outputs):
+        """Record the conversion of the given file with the given options (a
+        fingerprint, see fingerprint) into the given list of files."""
+        self.entries[os.path.abspath(file)] = {
+            'input': self._hash(file),
+            'options': options,
+            'outputs': self._outputs(outputs)}
+
+
+def fingerprint(options):
+    """Return a fingerprint of the given options (a dict of values that can be
+    converted to str)."""
+    return cache.hash_key(json.dumps(options, sort_keys=True, default=str))
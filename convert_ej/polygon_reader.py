@@ -0,0 +1,21 @@
+try:
+    # works for using pypi or command line
+    import formats
+    import readers
+except Exception:
+    from . import formats
+    from . import readers
+
+
+class PolygonReader(formats.Parsing, readers.Polygon):
+    """Interfaces command line parsing with a PolygonReader reader."""
+    def add_arguments(self, parser):
+        """Adds command line arguments for reading a problem in Polygon format."""
+        parser.add_argument('-sl', '--statement-language',
+                            dest='stmt_lang',
+                            default='english',
+                            help='Set statement language')
+
+    def read(self, file, args):
+        """Reads the problem in the Polygon format."""
+        return super().read(file, args.stmt_lang)
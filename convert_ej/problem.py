@@ -1,3 +1,6 @@
+from collections.abc import Mapping
+
+
 class Statement():
     """Stores the information required to state a problem.
 
@@ -16,8 +19,9 @@ class Statement():
         description -- problem specification
         in_format -- description of input format
         out_format -- description of output format
-        examples -- list of dict entries with 'in' (input) files and the
-                    expected 'out' (output) result
+        examples -- list of dict entries with 'in' (input) data and the
+                    expected 'out' (output) result, as bytes-like objects
+                    (or str)
         images -- dict of images used in the description (default {})
         tags -- list of tags for indexing the problem (default [])
         tutorial -- instructions on how to solve the problem (default None)
@@ -49,6 +53,38 @@ class Statement():
             assert isinstance(aux_files, dict)
 
 
+class TestCase(Mapping):
+    """Stores a test case whose data is only read when accessed.
+
+    Behaves as a dict with 'in' (input) and 'out' (output) bytes, but only
+    the names of the files are kept in memory: each access reads the data from
+    the archive, so it can be released as soon as it has been used.
+    """
+
+    def __init__(self, archive, files):
+        """Class constructor.
+
+        Keyword arguments:
+        archive -- where the data is stored, must provide a read(name) method
+                   that returns the bytes of the named file
+        files   -- dict with the 'in' (input) and 'out' (output) file names
+        """
+        self.archive = archive
+        self.files = files
+
+        assert 'in' in files
+        assert 'out' in files
+
+    def __getitem__(self, io):
+        return self.archive.read(self.files[io])
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+
 class Evaluation():
     """Stores the information required to evaluate a problem."""
 
@@ -57,12 +93,15 @@ class Evaluation():
 
         Keyword arguments:
         tests     -- dict of 'examples' and 'hidden' test cases, each case has a
-                     dict of 'in' (input) data and its expected 'out' (output).
+                     dict (or TestCase) of 'in' (input) data and its expected
+                     'out' (output), as bytes-like objects (or str).
         solutions -- list of solutions dicts, in the preferred order, where
-                     each entry is {file_extension: source_code}.
+                     each entry is {file_extension: source_code}, the source
+                     code as bytes (or str).
         limits    -- dict of 'time_sec' and 'memory_MB' limits for evaluation a
                      solution.
         checker   -- source code for the checker file, used to evaluate the answer
+                     (as bytes or str)
         """
         self.tests = tests
         self.solutions = solutions
@@ -80,7 +119,7 @@ class Evaluation():
 class Problem():
     """Stores the information required to present and evaluate a problem."""
 
-    def __init__(self, id, statement, evaluation):
+    def __init__(self, id, statement, evaluation, archive=None):
         """Class constructor.
 
         Keyword arguments:
@@ -88,11 +127,27 @@ class Problem():
               database indexing.
         statement -- an instance of Statement that describes the problem.
         evaluation -- an instance of Evaluation for evaluating a problem.
+        archive -- where the data of the tests is read from, if it must be
+                   closed once the problem is no longer used (see close).
         """
         self.id = id
         self.statement = statement
         self.evaluation = evaluation
+        self.archive = archive
 
         assert id
         assert isinstance(statement, Statement)
         assert isinstance(evaluation, Evaluation)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the archive the data of the tests is read from (if any), after
+        which the tests can no longer be read."""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
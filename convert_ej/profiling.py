@@ -0,0 +1,172 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+import types
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+
+class Profile():
+    """Wall time, CPU time and bytes processed by each phase of a conversion.
+
+    Phases are the readers' and writers' hooks (such as "_read_tests" or
+    "_write_pdf") and the external tools run (such as "tool pdflatex"). Nested
+    phases are also included in the phase they are run from, as is the CPU
+    time of the work a phase runs in other threads (see propagate).
+    """
+
+    def __init__(self):
+        """Class constructor."""
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def add(self, name, wall, cpu, nbytes=0, calls=1):
+        """Add the measures of (calls to) the given phase."""
+        with self.lock:
+            phase = self.phases.setdefault(name, {'calls': 0, 'wall': 0.0,
+                                                  'cpu': 0.0, 'bytes': 0})
+            phase['calls'] += calls
+            phase['wall'] += wall
+            phase['cpu'] += cpu
+            phase['bytes'] += nbytes
+
+    def merge(self, phases):
+        """Add the given phases (as returned by to_dict)."""
+        for name, phase in phases.items():
+            self.add(name, phase['wall'], phase['cpu'], phase['bytes'],
+                     phase['calls'])
+
+    def to_dict(self):
+        """Return the measures of each phase, as a dict."""
+        with self.lock:
+            return {name: dict(phase) for name, phase in self.phases.items()}
+
+
+class _Phase():
+    def __init__(self, name):
+        self.name = name
+        self.bytes = 0
+        # CPU time outside of the phase's thread (other threads and tools).
+        self.cpu = 0.0
+
+
+_profile = contextvars.ContextVar('profile', default=None)
+_phase = contextvars.ContextVar('phase', default=None)
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def count(nbytes):
+    """Add nbytes to the bytes processed by the current phase (if any)."""
+    if (current := _phase.get()) is not None:
+        with _profile.get().lock:
+            current.bytes += nbytes
+
+
+def instrument(cls, prefix):
+    """Measure the methods of cls whose names start with prefix (such as the
+    hooks of a reader or writer), as phases named after them."""
+    for name, method in list(vars(cls).items()):
+        if (name.startswith(prefix) and
+                isinstance(method, types.FunctionType) and
+                not getattr(method, '__isabstractmethod__', False)):
+            setattr(cls, name, timed(name)(method))
+
+
+@contextlib.contextmanager
+def phase(name, tool=False):
+    """Measure the code run in the context as the given phase, if profiling
+    (see profile).
+
+    For external tools, the CPU time of the child processes is included (which
+    also includes other tools run at the same time, if any).
+    """
+    profile = _profile.get()
+    parent = _phase.get()
+    if profile is None or (parent is not None and parent.name == name):
+        # Not profiling, or already measured (an override calling super()).
+        yield
+        return
+
+    current = _Phase(name)
+    token = _phase.set(current)
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    children_cpu = _children_cpu() if tool else 0.0
+    try:
+        yield
+    finally:
+        cpu = time.thread_time() - cpu
+        if tool:
+            current.cpu += _children_cpu() - children_cpu
+        _phase.reset(token)
+        profile.add(name, time.perf_counter() - wall, cpu + current.cpu,
+                    current.bytes)
+        if parent is not None:
+            # The parent's thread time already includes this thread's.
+            with profile.lock:
+                parent.bytes += current.bytes
+                parent.cpu += current.cpu
+
+
+@contextlib.contextmanager
+def profile(into=None):
+    """Measure the phases of whatever is run in the context (including other
+    threads, see propagate) into the given Profile (a new one, if None), which
+    is returned.
+
+    For example:
+
+        with profiling.profile() as profile:
+            problem = readers.Polygon().read(file)
+            writers.BOCA().write(problem)
+        print(profile.to_dict())
+    """
+    profile = into or Profile()
+    profile_token = _profile.set(profile)
+    phase_token = _phase.set(None)
+    try:
+        yield profile
+    finally:
+        _phase.reset(phase_token)
+        _profile.reset(profile_token)
+
+
+def propagate(function):
+    """Return function so that it is measured along with the current phase
+    (and its events recorded, see events.record), when run (once) in another
+    thread (such as in an executor): its CPU time, bytes and nested phases are
+    added to the current phase."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        cpu = time.thread_time()
+        try:
+            return context.run(function, *args, **kwargs)
+        finally:
+            if (current := context.get(_phase)) is not None:
+                with context.get(_profile).lock:
+                    current.cpu += time.thread_time() - cpu
+    return wrapper
+
+
+def timed(name):
+    """Decorator measuring each call to the function as the given phase."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -6,13 +6,24 @@ import zipfile
 
 try:
     # works for using pypi or command line
+    import archive
+    import events
     import problem
+    import profiling
 except Exception:
+    from . import archive
+    from . import events
     from . import problem
+    from . import profiling
 
 
 class Reader(ABC):
     """Abstract class for reading an E-judge problem."""
+    def __init_subclass__(cls, **kwargs):
+        # Each hook is a phase when profiling.
+        super().__init_subclass__(**kwargs)
+        profiling.instrument(cls, '_read_')
+
     @abstractmethod
     def _read_aux_files(self):
         pass
@@ -89,12 +100,16 @@ class Reader(ABC):
 
 class ZipReader(Reader):
     """Abstract file for reading an E-judge problem from a zip file."""
-    def _get_in_zip(self, file):
-        try:
-            with self.pzip.open(file) as f:
-                return f.read().decode('utf-8')
-        except KeyError as e:
-            raise ValueError(e)
+    def _get_in_zip(self, file, decode=True):
+        data = self.archive.read(file)
+        return str(data, 'utf-8') if decode else data
+
+    def _get_test(self, in_file, out_file):
+        """Return a TestCase that reads the given files only when needed."""
+        self.archive.check(in_file)
+        self.archive.check(out_file)
+        return problem.TestCase(self.archive,
+                                {'in': in_file, 'out': out_file})
 
     def read(self, file):
         """
@@ -102,13 +117,24 @@ class ZipReader(Reader):
         file -- the file containing the data for the problem
         """
         try:
-            with zipfile.ZipFile(file) as pzip:
-                self.pzip = pzip
-                return super().read(file)
-
+            self.archive = archive.ZipArchive(file)
         except zipfile.BadZipFile as e:
             raise ValueError(f'{e}')
 
+        try:
+            self.pzip = self.archive.pzip
+            ejproblem = super().read(file)
+        except BaseException as e:
+            self.archive.close()
+            if isinstance(e, zipfile.BadZipFile):
+                raise ValueError(f'{e}')
+            raise
+
+        # The archive stays open after reading, for the tests' data, until
+        # the problem is closed.
+        ejproblem.archive = self.archive
+        return ejproblem
+
 
 class BOCA(ZipReader):
     """Reads a BOCA problem from file and returns it as an Problem.
@@ -126,13 +152,11 @@ class BOCA(ZipReader):
 
     def _read_aux_files(self):
         aux_files = {}
-        for entry in self.pzip.namelist():
-            if (entry.startswith('tex/') and
-                    not self.pzip.getinfo(entry).is_dir()):
-                entry_name = os.path.split(entry)[-1].lower()
-                if not entry_name.endswith(('.tex', '.cls', 'examples.csv')):
-                    with self.pzip.open(entry) as f:
-                        aux_files[entry_name] = f.read()
+        for entry in self.archive.list_dir('tex', recursive=True):
+            entry_name = os.path.split(entry)[-1].lower()
+            if not entry_name.endswith(('.tex', '.cls', 'examples.csv')):
+                aux_files[entry_name] = self._get_in_zip(entry,
+                                                         decode=False)
 
         return aux_files
 
@@ -144,16 +168,30 @@ class BOCA(ZipReader):
 
     def _read_examples(self):
         examples = {}
-        for num in self._get_in_zip('tex/examples.csv').split(','):
+        for num in self._get_samples():
             examples[num] = {}
-            examples[num]['in'] = self._get_in_zip(f'input/{num}')
-            examples[num]['out'] = self._get_in_zip(f'output/{num}')
+            examples[num]['in'] = self._get_in_zip(f'input/{num}',
+                                                   decode=False)
+            examples[num]['out'] = self._get_in_zip(f'output/{num}',
+                                                    decode=False)
 
         return [examples[k] for k in sorted(examples.keys())]
 
+    def _get_info(self):
+        if self.info is None:
+            lines = self._get_in_zip('description/problem.info').splitlines()
+            self.info = dict(line.split('=', 1) for line in lines if '=' in line)
+
+        return self.info
+
+    def _get_samples(self):
+        if self.samples is None:
+            self.samples = self._get_in_zip('tex/examples.csv').split(',')
+
+        return self.samples
+
     def _read_id(self):
-        info = self._get_in_zip('description/problem.info').split('\n')
-        return info[0].split('=')[1]
+        return self._get_info()['basename']
 
     def _read_input(self):
         return self._read_stmt_tex('input')
@@ -180,8 +218,8 @@ class BOCA(ZipReader):
             else:
                 raise ValueError('Limits not found.')
 
-        for entry in self.pzip.namelist():
-            if entry.lower().startswith('solutions/main'):
+        for entry in self.archive.list_dir('solutions'):
+            if os.path.split(entry)[-1].lower().startswith('main'):
                 _, ext = os.path.splitext(entry)
                 ext = ext[1:]  # remove leading '.'
                 return try_for_python() if ext == 'py' else get_limits(ext)
@@ -193,9 +231,10 @@ class BOCA(ZipReader):
 
     def _read_solutions(self):
         def source(tag):
-            return {os.path.splitext(entry)[1][1:]: self._get_in_zip(entry)
-                    for entry in self.pzip.namelist()
-                    if entry.lower().startswith(f'solutions/{tag}')}
+            return {os.path.splitext(entry)[1][1:]:
+                    self._get_in_zip(entry, decode=False)
+                    for entry in self.archive.list_dir('solutions')
+                    if os.path.split(entry)[-1].lower().startswith(tag)}
 
         return [source('main'), source('accepted')]
 
@@ -208,6 +247,7 @@ class BOCA(ZipReader):
                 raise e
 
         print(f'\t{file} not in zip.')
+        events.emit('warning', message=f'{file} not in zip')
         return ''
 
     def _read_tags(self):
@@ -217,25 +257,33 @@ class BOCA(ZipReader):
 
     def _read_tests(self):
         test_files = [os.path.split(entry)[-1]
-                      for entry in self.pzip.namelist()
-                      if entry.startswith('input/') and entry != 'input/']
+                      for entry in self.archive.list_dir('input')]
 
-        test_samples = self._get_in_zip('tex/examples.csv').split(',')
+        test_samples = self._get_samples()
 
         tests = {'examples': {}, 'hidden': {}}
         for name in sorted(test_files):
             test = 'examples' if (name in test_samples) else 'hidden'
-            tests[test][name] = {'in': self._get_in_zip(f'input/{name}'),
-                                 'out': self._get_in_zip(f'output/{name}')}
+            tests[test][name] = self._get_test(f'input/{name}',
+                                               f'output/{name}')
         return tests
 
     def _read_title(self):
-        info = self._get_in_zip('description/problem.info').split('\n')
-        return info[1].split('=')[1]
+        return self._get_info()['fullname']
 
     def _read_tutorial(self):
         return self._read_stmt_tex('tutorial')
 
+    def read(self, file):
+        """Reads a BOCA problem from file and returns it as an Problem.
+
+        Keyword arguments:
+        file -- the file containing the data for the problem
+        """
+        self.info = None
+        self.samples = None
+        return super().read(file)
+
 
 class Polygon(ZipReader):
     def _get_root(self):
@@ -247,40 +295,38 @@ class Polygon(ZipReader):
 
     def _read_aux_files(self):
         aux_files = {}
-        path = os.path.join('statement-sections', self.stmt_lang)
-        for entry in self.pzip.namelist():
-            if (not self.pzip.getinfo(entry).is_dir() and
-                    entry.startswith(path)):
-                entry_name = os.path.split(entry)[1].lower()
-                if not (entry_name.startswith('example.') or
-                        entry_name.endswith('.tex')):
-                    with self.pzip.open(entry) as f:
-                        aux_files[entry_name] = f.read()
+        path = f'statement-sections/{self.stmt_lang}'
+        for entry in self.archive.list_dir(path, recursive=True):
+            entry_name = os.path.split(entry)[1].lower()
+            if not (entry_name.startswith('example.') or
+                    entry_name.endswith('.tex')):
+                aux_files[entry_name] = self._get_in_zip(entry,
+                                                         decode=False)
 
         return aux_files
 
     def _read_checker(self):
         path = 'check.cpp'
-        return self._get_in_zip(path)
+        return self._get_in_zip(path, decode=False)
 
     def _read_description(self):
         return self._read_stmt_tex('legend')
 
     def _read_examples(self):
         examples = {}
-        path = os.path.join('statement-sections', self.stmt_lang)
-        for entry in self.pzip.namelist():
-            if (not self.pzip.getinfo(entry).is_dir()
-                    and entry.startswith(path)):
-                entry_name = os.path.split(entry)[1]
-                if entry_name.startswith('example.'):
-                    ex = entry_name.split('.')[1]
-                    if ex not in examples:
-                        examples[ex] = {}
-                    if entry_name.endswith('.a'):
-                        examples[ex]['out'] = self._get_in_zip(entry)
-                    else:
-                        examples[ex]['in'] = self._get_in_zip(entry)
+        path = f'statement-sections/{self.stmt_lang}'
+        for entry in self.archive.list_dir(path, recursive=True):
+            entry_name = os.path.split(entry)[1]
+            if entry_name.startswith('example.'):
+                ex = entry_name.split('.')[1]
+                if ex not in examples:
+                    examples[ex] = {}
+                if entry_name.endswith('.a'):
+                    examples[ex]['out'] = self._get_in_zip(entry,
+                                                           decode=False)
+                else:
+                    examples[ex]['in'] = self._get_in_zip(entry,
+                                                          decode=False)
 
         return [examples[k] for k in sorted(examples.keys())]
 
@@ -312,7 +358,8 @@ class Polygon(ZipReader):
             return 'py' if attr == 'python'else attr
 
         def source(tag):
-            return {src(e.attrib['type']): self._get_in_zip(e.attrib['path'])
+            return {src(e.attrib['type']):
+                    self._get_in_zip(e.attrib['path'], decode=False)
                     for e in self._get_root().findall(
                         f'assets/solutions/solution[@tag="{tag}"]/source')}
 
@@ -328,6 +375,7 @@ class Polygon(ZipReader):
                 raise e
 
         print(f'\t{file} not in zip.')
+        events.emit('warning', message=f'{file} not in zip')
         return ''
 
     def _read_tags(self):
@@ -338,9 +386,8 @@ class Polygon(ZipReader):
 
     def _read_tests(self):
         test_files = [entry
-                      for entry in self.pzip.namelist()
-                      if entry.startswith('tests/') and entry != 'tests/'
-                      and not entry.endswith('.a')]
+                      for entry in self.archive.list_dir('tests')
+                      if not entry.endswith('.a')]
         test_samples = ['sample' in e.attrib
                         for e in self._get_root().findall(
                             'judging/testset/tests/test')]
@@ -351,8 +398,7 @@ class Polygon(ZipReader):
         for path, is_sample in zip(sorted(test_files), test_samples):
             test = 'examples' if is_sample else 'hidden'
             file = os.path.split(path)[-1]
-            tests[test][file] = {'in': self._get_in_zip(path),
-                                 'out': self._get_in_zip(f'{path}.a')}
+            tests[test][file] = self._get_test(path, f'{path}.a')
 
         return tests
 
@@ -0,0 +1,222 @@
+import functools
+import json
+import re
+
+try:
+    # works for using pypi or command line
+    import cache
+except Exception:
+    from . import cache
+
+# Must change whenever to_html's output does, so HTML cached on disk by
+# previous versions is not used.
+VERSION = '1'
+
+# Single pattern for everything that is converted, the text in between is
+# copied as is. The order of the alternatives matters.
+TOKENS = re.compile(r'''
+    (?P<display>\$\$|\\\[)
+  | (?P<inline>\$|\\\()
+  | (?P<begin>\\begin\{(?P<begin_env>[^}]*)\})
+  | (?P<end>\\end\{(?P<end_env>[^}]*)\})
+  | (?P<image>\\includegraphics(?:\[(?P<options>[^\]]*)\])?\{(?P<file>[^}]*)\})
+  | (?P<command>\\(?P<name>[a-zA-Z]+)(?P<arg>\{)?)
+  | (?P<escaped>\\.)
+  | (?P<open>\{)
+  | (?P<close>\})
+  | (?P<paragraph>\n\n)
+  | (?P<open_quotes>``)
+  | (?P<close_quotes>'')
+  | (?P<backtick>`)
+''', re.VERBOSE | re.DOTALL)
+
+# Closing delimiter and HTML for each kind of math.
+MATH = {'$$': ('$$', '\\[', '\\]'),
+        '\\[': ('\\]', '\\[', '\\]'),
+        '$': ('$', '\\(', '\\)'),
+        '\\(': ('\\)', '\\(', '\\)')}
+
+# Commands with an argument, and the HTML tag the argument is enclosed in.
+FONTS = {'textbf': 'b', 'bf': 'b',
+         'textit': 'i', 'it': 'i', 'emph': 'i',
+         'textrm': None, 'mbox': None,
+         'texttt': 'tt', 'tt': 'tt', 't': 'tt'}
+
+# Environments and the HTML they start/end with.
+ENVIRONMENTS = {'itemize': ('<ul>', '</ul>'),
+                'enumerate': ('<ol>', '</ol>'),
+                'center': ('<p style="text-align: center;">', '</p>')}
+LISTS = ('itemize', 'enumerate')
+
+IMAGE_SCALE = re.compile(r'scale.*?= *([0-9]*\.?[0-9]+)')
+IMAGE_WIDTH = re.compile(r'width.*?= *([0-9]*\.?[0-9]+) *\\textwidth')
+
+
+def _image(file, options, aux_files, warnings):
+    def check_file(file):
+        if file in aux_files:
+            return file
+
+        # Extension may have been omitted
+        for img in aux_files:
+            if img.startswith(f'{file.lower()}'):
+                return img
+        raise ValueError(f'Cannot find {file} image')
+
+    def parse(options):
+        if options:
+            options = options.lower()
+            m = IMAGE_SCALE.search(options) or IMAGE_WIDTH.search(options)
+            if m:
+                return f'width="{int(float(m.group(1)) * 100)}%"'
+            warnings.append(f'Image {file} has unknown options ({options}).')
+        return ''
+
+    image = f'src="@@PLUGINFILE@@/{check_file(file)}" {parse(options)}'
+    return f'<img {image}> </img>'
+
+
+def to_html(s, aux_files=()):
+    """Convert the given TeX text to HTML in a single pass.
+
+    Math is kept as is (using MathJax delimiters), fonts (which may be nested),
+    lists, centering, verbatim, images and quotes are converted to their HTML
+    counterparts.
+
+    Keyword arguments:
+    s -- the TeX text
+    aux_files -- names of the available images
+
+    Returns the HTML and a list of warnings about what could not be converted.
+    """
+    html = []
+    warnings = []
+    groups = []  # What closes each open "{", None for a literal "}".
+    envs = []  # Open environments.
+    items = []  # For each open list, whether an item is open.
+    quoting = False
+
+    pos = 0
+    while m := TOKENS.search(s, pos):
+        html.append(s[pos:m.start()])
+        pos = m.end()
+
+        if m.group('display') or m.group('inline'):
+            token = m.group(0)
+            closing, start, end = MATH[token]
+            close = s.find(closing, pos)
+            if close < 0:
+                html.append(token)
+            else:
+                html.extend((start, s[pos:close], end))
+                pos = close + len(closing)
+
+        elif m.group('begin'):
+            env = m.group('begin_env')
+            if env == 'verbatim':
+                close = s.find('\\end{verbatim}', pos)
+                if close < 0:
+                    html.append(m.group(0))
+                    warnings.append(f'Possible unformatted TeX command: '
+                                    f'{m.group(0)}')
+                else:
+                    html.extend(('<pre>', s[pos:close], '</pre>'))
+                    pos = close + len('\\end{verbatim}')
+            elif env in ENVIRONMENTS:
+                envs.append(env)
+                if env in LISTS:
+                    items.append(False)
+                html.append(ENVIRONMENTS[env][0])
+            else:
+                html.append(m.group(0))
+                warnings.append(f'Possible unformatted TeX command: '
+                                f'{m.group(0)}')
+
+        elif m.group('end'):
+            env = m.group('end_env')
+            if envs and envs[-1] == env:
+                envs.pop()
+                if env in LISTS and items.pop():
+                    html.append('</li>\n')
+                html.append(ENVIRONMENTS[env][1])
+            else:
+                html.append(m.group(0))
+                warnings.append(f'Possible unformatted TeX command: '
+                                f'{m.group(0)}')
+
+        elif m.group('image'):
+            html.append(_image(m.group('file'), m.group('options'), aux_files,
+                               warnings))
+
+        elif m.group('command'):
+            name = m.group('name')
+            if m.group('arg') and name in FONTS:
+                tag = FONTS[name]
+                html.append(f'<{tag}>' if tag else '')
+                groups.append(f'</{tag}>' if tag else '')
+            elif name == 'item' and items:
+                if items[-1]:
+                    html.append('</li>\n')
+                html.append('<li>')
+                items[-1] = True
+                if s.startswith(' ', pos):
+                    pos += 1
+            elif name == 'textbackslash':
+                html.append('\\')
+                if m.group('arg'):
+                    html.append('{')
+                    groups.append(None)
+            else:
+                html.append(m.group(0))
+                if m.group('arg'):
+                    groups.append(None)
+                warnings.append(f'Possible unformatted TeX command: \\{name}')
+
+        elif m.group('open'):
+            html.append('{')
+            groups.append(None)
+
+        elif m.group('close'):
+            closing = groups.pop() if groups else None
+            html.append('}' if closing is None else closing)
+
+        elif m.group('paragraph'):
+            html.append('\n</p>\n<p>\n')
+
+        elif m.group('open_quotes'):
+            html.append('"')
+            quoting = True
+
+        elif m.group('close_quotes'):
+            html.append('"' if quoting else "''")
+            quoting = False
+
+        elif m.group('backtick'):
+            html.append("'")
+
+        else:  # escaped
+            html.append(m.group(0))
+
+    html.append(s[pos:])
+    return ''.join(html), warnings
+
+
+@functools.lru_cache(maxsize=256)
+def cached_to_html(s, aux_files=(), cache_dir=None, cache_MB=256):
+    """Memoized version of to_html (aux_files must be a tuple).
+
+    If cache_dir is given, the results are also cached on disk, so they can be
+    reused by other runs. The warnings are returned as a tuple.
+    """
+    if cache_dir is None:
+        html, warnings = to_html(s, aux_files)
+        return html, tuple(warnings)
+
+    html_cache = cache.Cache(cache_dir, cache_MB)
+    key = cache.hash_key(VERSION, s, *aux_files)
+    if (data := html_cache.get(key)) is not None:
+        html, warnings = json.loads(data)
+    else:
+        html, warnings = to_html(s, aux_files)
+        html_cache.put(key, json.dumps([html, warnings]).encode('utf-8'))
+    return html, tuple(warnings)
@@ -0,0 +1,74 @@
+import contextlib
+import contextvars
+import os
+import subprocess
+import threading
+
+try:
+    # works for using pypi or command line
+    import profiling
+except Exception:
+    from . import profiling
+
+# How many runs of each tool may be at the same time (any other tool, one
+# per CPU). pdflatex and ImageMagick's convert (at 600 dpi) may take hundreds
+# of MB each, unlike compiling a checker.
+LIMITS = {'convert': 2, 'pdflatex': 2}
+
+# Runs the tools instead of subprocess, when set (see runner).
+_runner = contextvars.ContextVar('runner', default=None)
+# The limits of the tools run with subprocess (in this process).
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _call(cmd, cwd=None, capture=False):
+    tool = os.path.basename(cmd[0])
+    with profiling.phase(f'tool {tool}', tool=True):
+        if (current := _runner.get()) is not None:
+            return current.call(cmd, cwd, capture)
+        with _semaphores_lock:
+            if tool not in _semaphores:
+                _semaphores[tool] = threading.Semaphore(limit(tool))
+        with _semaphores[tool]:
+            if capture:
+                return subprocess.check_output(cmd, cwd=cwd)
+            subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL,
+                           check=True)
+
+
+def limit(tool, limits=LIMITS):
+    """Return how many runs of the given tool may be at the same time,
+    according to limits (a dict of tool names and numbers of runs)."""
+    return limits.get(tool, os.cpu_count() or 1)
+
+
+def output(cmd):
+    """Run the given command (a list) and return its output."""
+    return _call(cmd, capture=True)
+
+
+def run(cmd, error, cwd=None):
+    """Run the given command (a list) in cwd, discarding its output (see
+    LIMITS).
+
+    Raises ValueError with the given error message if the command fails.
+    """
+    try:
+        _call(cmd, cwd)
+    except subprocess.CalledProcessError:
+        raise ValueError(error)
+
+
+@contextlib.contextmanager
+def runner(tool_runner):
+    """Run the tools called in the context (including other threads, see
+    profiling.propagate) with the given runner, whose method call(cmd, cwd,
+    capture) blocks until the command is done, returning its output if
+    capture is True and raising subprocess.CalledProcessError if it fails
+    (see batch.AsyncRunner)."""
+    token = _runner.set(tool_runner)
+    try:
+        yield tool_runner
+    finally:
+        _runner.reset(token)
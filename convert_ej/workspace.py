@@ -0,0 +1,98 @@
+import os
+import posixpath
+import shutil
+import tempfile
+
+
+class Workspace():
+    """Files used for building something, such as a problem's PDF.
+
+    The files are named by relative paths (using "/"). In memory mode they are
+    only written to disk when some tool needs them (see materialize), otherwise
+    they are written right away. Either way, they go to a directory unique to
+    the workspace, so concurrent builds never share files.
+
+    Use it as a context manager, so the directory is removed afterwards.
+    """
+
+    def __init__(self, tmp_dir='/tmp', prefix='', in_memory=True):
+        """Class constructor.
+
+        Keyword arguments:
+        tmp_dir -- where the workspace's directory is created (such as a
+                   tmpfs mount), if needed
+        prefix -- prefix for the name of the workspace's directory
+        in_memory -- boolean to keep the files in memory (or on disk)
+        """
+        self.tmp_dir = tmp_dir
+        self.prefix = prefix
+        self.in_memory = in_memory
+        self.dir = None
+        self.files = {}  # Name to data (None if only on disk).
+        self.on_disk = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _make_dir(self):
+        if self.dir is None:
+            os.makedirs(self.tmp_dir, exist_ok=True)
+            self.dir = os.path.abspath(tempfile.mkdtemp(prefix=self.prefix,
+                                                        dir=self.tmp_dir))
+        return self.dir
+
+    def _to_disk(self, name, data):
+        self._make_dir()
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.on_disk.add(name)
+
+    def close(self):
+        """Remove the workspace's directory (if it was created)."""
+        if self.dir is not None:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir = None
+        self.files.clear()
+        self.on_disk.clear()
+
+    def list_dir(self, path):
+        """Return the sorted names of the files in the given directory."""
+        return sorted(posixpath.basename(name)
+                      for name in self.files
+                      if posixpath.dirname(name) == path)
+
+    def materialize(self, *names):
+        """Write the given files (or directories, with all their files) to
+        disk, and return the path of the workspace's directory."""
+        for name, data in self.files.items():
+            if name not in self.on_disk and any(
+                    name == n or name.startswith(f'{n}/') for n in names):
+                self._to_disk(name, data)
+        return self._make_dir()
+
+    def path(self, name):
+        """Return the path of the given file on disk (see materialize)."""
+        return os.path.join(self.dir, *name.split('/'))
+
+    def read(self, name):
+        """Return the bytes of the given file."""
+        if (data := self.files[name]) is None:
+            with open(self.path(name), 'rb') as f:
+                data = f.read()
+        return data
+
+    def write(self, name, data):
+        """Write data (bytes-like or str, encoded as UTF-8) to the given file.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.in_memory and name not in self.on_disk:
+            self.files[name] = data
+        else:
+            self._to_disk(name, data)
+            self.files[name] = data if self.in_memory else None
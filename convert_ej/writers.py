@@ -1,16 +1,41 @@
 from abc import ABC, abstractmethod
 import base64
+import functools
 import os
 import re
 import shutil
-import subprocess
+import tempfile
 import xml.etree.ElementTree as ET
 import zipfile
-from unidecode import unidecode
+
+try:
+    # works for using pypi or command line
+    import archive
+    import cache
+    import events
+    import problem
+    import profiling
+    import tex
+    import tools
+    import workspace
+except Exception:
+    from . import archive
+    from . import cache
+    from . import events
+    from . import problem
+    from . import profiling
+    from . import tex
+    from . import tools
+    from . import workspace
 
 
 class Writer(ABC):
     """Abstract class for writing an E-judge problem."""
+    def __init_subclass__(cls, **kwargs):
+        # Each hook is a phase when profiling.
+        super().__init_subclass__(**kwargs)
+        profiling.instrument(cls, '_write_')
+
     @abstractmethod
     def _write_aux_files(self):
         pass
@@ -88,32 +113,173 @@ class Writer(ABC):
         self._write_limits()
 
 
+@functools.lru_cache()
+def parse_template(xml):
+    """Return the root of the given XML template, parsed only once (clone it
+    before making any changes)."""
+    return ET.parse(xml).getroot()
+
+
+# Tag of the elements whose text is written as a CDATA section.
+CDATA_TAG = '![CDATA['
+
+
+def escape(text, attribute=False):
+    """Return the text escaped for XML (as done by ElementTree)."""
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    if attribute:
+        text = text.replace('"', '&quot;').replace('\r', '&#13;')
+        text = text.replace('\n', '&#10;').replace('\t', '&#09;')
+    return text
+
+
+def start_tag(element):
+    """Return the serialized start tag of the element, followed by its text."""
+    attributes = ''.join(f' {key}="{escape(value, True)}"'
+                         for key, value in element.items())
+    return f'<{element.tag}{attributes}>{escape(element.text or "")}'
+
+
+def end_tag(element):
+    """Return the serialized end tag of the element, followed by its tail."""
+    return f'</{element.tag}>{escape(element.tail or "")}'
+
+
+def serialize(element):
+    """Return the XML of the element (followed by its tail).
+
+    Same as ElementTree.tostring, except that the text of elements tagged
+    CDATA_TAG is written as a CDATA section. Since it does not change
+    ElementTree's behavior, it is safe to use in multiple threads.
+    """
+    def write(element):
+        if element.tag == CDATA_TAG:
+            xml.append(f'\n<{CDATA_TAG}{element.text}]]>\n')
+        elif element.text or len(element):
+            xml.append(start_tag(element))
+            for child in element:
+                write(child)
+            xml.append(end_tag(element))
+        else:
+            attributes = ''.join(f' {key}="{escape(value, True)}"'
+                                 for key, value in element.items())
+            xml.append(f'<{element.tag}{attributes} />'
+                       f'{escape(element.tail or "")}')
+
+    xml = []
+    write(element)
+    return ''.join(xml)
+
+
+def copy_bytes(src, dest, size, buffer_size=2 ** 20):
+    """Copy size bytes from the file object src to dest."""
+    while size > 0:
+        data = src.read(min(size, buffer_size))
+        if not data:
+            break
+        dest.write(data)
+        size -= len(data)
+
+
+def to_bytes(data):
+    """Return data (bytes-like or str) as bytes-like, encoding str as UTF-8."""
+    return data.encode('utf-8') if isinstance(data, str) else data
+
+
+def to_text(data):
+    """Return data (bytes-like or str) as str, decoding it as UTF-8 (or as
+    Latin-1, if it is not valid UTF-8)."""
+    if isinstance(data, str):
+        return data
+    try:
+        return str(data, 'utf-8')
+    except UnicodeDecodeError:
+        return str(data, 'latin-1')
+
+
+def clone(element):
+    """Return a copy of the given XML element (much cheaper than deepcopy)."""
+    copy = ET.Element(element.tag, element.attrib)
+    copy.text = element.text
+    copy.tail = element.tail
+    copy.extend([clone(child) for child in element])
+    return copy
+
+
+@functools.lru_cache()
+def compiler_version(compiler):
+    """Return the version information of the given compiler."""
+    return tools.output([compiler, '--version'])
+
+
 class BOCA(Writer):
     """Writes an E-judge problem in BOCA format."""
-    def _write(self, name, content, mode='w', ext='.tex'):
-        # To temporary dir.
-        file = os.path.join(self.tmp_tex_dir, f'{name}{ext}')
-        with open(file, mode) as f:
-            f.write(content)
-
-        # To the zip.
-        file = os.path.join('tex', f'{name}{ext}')
-        self.pzip.writestr(file, content)
+    CHECKER_FLAGS = ['-static', '-DBOCA_SUPPORT']
+    # Compression of the zip members for each mode, as (compress_type,
+    # compresslevel). It matters mostly for the tests.
+    COMPRESSION = {'store': (zipfile.ZIP_STORED, None),
+                   'fast': (zipfile.ZIP_DEFLATED, 1),
+                   'default': (zipfile.ZIP_DEFLATED, None),
+                   'small': (zipfile.ZIP_DEFLATED, 9)}
+    # Files already compressed, which are always stored.
+    STORED = ('.gif', '.jpeg', '.jpg', '.pdf', '.png')
+
+    def _write(self, name, content, ext='.tex'):
+        # To the workspace (for pdflatex) and to the zip.
+        file = f'tex/{name}{ext}'
+        self.workspace.write(file, content)
+        self._writestr(file, content)
+
+    def _compression(self, name):
+        if name.lower().endswith(BOCA.STORED):
+            return zipfile.ZIP_STORED, None
+        return self.compress_type, self.compresslevel
+
+    def _writestr(self, name, data):
+        self.pzip.writestr(name, data, *self._compression(name))
+        profiling.count(len(data))
+
+    def _call(self, cmd, error, cwd=None):
+        tools.run(cmd, error, cwd)
+
+    def _pdflatex(self, tex_file, cwd):
+        cmd = ['pdflatex', '-interaction=nonstopmode', '-halt-on-error',
+               tex_file]
+        self._call(cmd, f'Unable to create pdf from {tex_file}', cwd)
+
+    def _pdfunite(self, dest, origins, cwd):
+        cmd = ['pdfunite'] + list(origins) + [dest]
+        self._call(cmd, f'Unable to join pdfs into {dest}.', cwd)
+
+    def _set_templates(self):
+        self.module_dir = os.path.abspath(os.path.dirname(__file__))
+        self.template_dir = os.path.join(self.module_dir, 'templates', 'BOCA')
+        self.template_tex_dir = os.path.join(self.template_dir, 'tex')
 
     def _write_aux_files(self):
         def aux_files():
+            members = []
             for name, file in self.problem.statement.aux_files.items():
-                self._write(name, file, mode='wb', ext='')
+                arcname = f'tex/{name}'
+                self.workspace.write(arcname, file)
+                members.append(functools.partial(archive.compress, arcname,
+                                                 file,
+                                                 *self._compression(arcname)))
+            archive.write_all(self.pzip, members, self.zip_threads)
 
         def template_dirs():
             def write_tmpl(dir_path):
+                # Most templates are the same for all languages, they are
+                # compressed only once.
+                templates = {}
                 with os.scandir(dir_path) as it:
                     dir_name = os.path.split(dir_path)[-1]
-                    for entry in it:
+                    for entry in sorted(it, key=lambda entry: entry.name):
                         with open(entry.path, 'rb') as template:
-                            with self.pzip.open(f'{dir_name}/{entry.name}',
-                                                'w') as f:
-                                f.write(template.read())
+                            templates.setdefault(template.read(), []).append(
+                                f'{dir_name}/{entry.name}')
+                for data, names in templates.items():
+                    archive.write_copies(self.pzip, names, data)
 
             with os.scandir(self.template_dir) as it:
                 for entry in it:
@@ -125,31 +291,47 @@ class BOCA(Writer):
 
     def _write_checker(self):
         def compile_checker():
-            testlib_path = os.path.join(self.template_dir, 'testlib.h')
-            compile_path = os.path.join(self.tmp_dir, 'testlib.h')
-            shutil.copy(testlib_path, compile_path)
-
-            cmd = ['g++', '-static', '-DBOCA_SUPPORT', checker_path, '-o',
-                   checker_binary_path]
-            with open(os.devnull, 'w') as DEVNULL:
-                try:
-                    subprocess.check_call(cmd, cwd=self.tmp_tex_dir,
-                                          stdout=DEVNULL)
-                except subprocess.CalledProcessError:
-                    raise ValueError('Unable to compile checker.')
+            # Only the files g++ needs reach the disk.
+            self.workspace.write('checker.cpp', checker_file)
+            self.workspace.write('testlib.h', testlib)
+            cwd = self.workspace.materialize('checker.cpp', 'testlib.h')
+
+            cmd = (['g++'] + BOCA.CHECKER_FLAGS +
+                   ['checker.cpp', '-o', 'bin'])
+            self._call(cmd, 'Unable to compile checker.', cwd)
+
+            with open(os.path.join(cwd, 'bin'), 'rb') as f:
+                return f.read()
+
+        def cache_key():
+            # Anything that changes the binary must be in the key.
+            return cache.hash_key(checker_file, testlib,
+                                  compiler_version('g++'),
+                                  ' '.join(BOCA.CHECKER_FLAGS))
 
         def write_checker_to_zip():
-            with open(checker_binary_path, 'rb') as f:
-                bin_file = f.read()
-            for ext in ('c', 'cc', 'cpp', 'kt', 'java', 'py2', 'py3'):
-                self.pzip.writestr(f'compare/{ext}', bin_file)
+            archive.write_copies(self.pzip,
+                                 [f'compare/{ext}'
+                                  for ext in ('c', 'cc', 'cpp', 'kt', 'java',
+                                              'py2', 'py3')],
+                                 bin_file)
 
         if checker_file := self.problem.evaluation.checker:
-            checker_path = os.path.join(self.tmp_dir, 'checker.cpp')
-            checker_binary_path = os.path.join(self.tmp_dir, 'bin')
-            with open(checker_path, 'w') as f:
-                f.write(checker_file)
-            compile_checker()
+            with open(os.path.join(self.template_dir, 'testlib.h'), 'rb') as f:
+                testlib = f.read()
+
+            bin_file = None
+            if self.cache_dir:
+                checker_cache = cache.Cache(
+                    os.path.join(self.cache_dir, 'checkers'), self.cache_MB)
+                key = cache_key()
+                bin_file = checker_cache.get(key)
+
+            if bin_file is None:
+                bin_file = compile_checker()
+                if self.cache_dir:
+                    checker_cache.put(key, bin_file)
+
             write_checker_to_zip()
 
     def _write_description(self):
@@ -157,24 +339,25 @@ class BOCA(Writer):
 
     def _write_examples(self):
         examples = []
-        # Write examples to temporary dir
-        os.mkdir(os.path.join(self.tmp_dir, 'input'))
-        os.mkdir(os.path.join(self.tmp_dir, 'output'))
+        # Write examples to the workspace (for pdflatex)
         for e, io in self.problem.evaluation.tests['examples'].items():
             examples.append(e)
             for key, value in io.items():
-                file = os.path.join(self.tmp_dir, f'{key}put', e)
-                with open(file, 'w') as f:
-                    f.write(value)
+                self.workspace.write(f'{key}put/{e}', value)
 
         # Write list to TeX
         self._write('examples', ','.join(examples), ext='.csv')
 
+    def _basename(self):
+        # Remove all special characters and accents (only needed by BOCA, so
+        # unidecode is only imported when writing it).
+        from unidecode import unidecode
+
+        title = unidecode(self.problem.statement.title.lower())
+        return ''.join(c for c in title if c.isalnum())
+
     def _write_id(self):
-        # Remove all special characters and accents (same process done in _write_pdf)
-        title = self.problem.statement.title
-        title = unidecode(title.lower())
-        title = ''.join(c for c in title if c.isalnum())
+        title = self._basename()
         self.pzip.writestr('description/problem.info',
                            f'basename={title}\n'
                            f'fullname={title}\n'
@@ -211,34 +394,7 @@ class BOCA(Writer):
     def _write_notes(self):
         self._write('notes', self.problem.statement.notes)
 
-    def _write_pdf(self, options, pdf_front='', index=0):
-        def call_pdflatex(tex_file):
-            cmd = [
-                'pdflatex', '-interaction=nonstopmode', '-halt-on-error',
-                tex_file
-            ]
-            with open(os.devnull, 'w') as DEVNULL:
-                try:
-                    subprocess.check_call(cmd, cwd=self.tmp_tex_dir,
-                                          stdout=DEVNULL)
-                except subprocess.CalledProcessError as e:
-                    # # run again to show errors
-                    # try:
-                    #     subprocess.check_call(cmd, cwd=self.tmp_tex_dir)
-                    # except Exception:
-                    #     raise ValueError(f'Unable to create pdf '
-                    #                      f'from {tex_file}.tex')
-                    raise ValueError(f'Unable to create pdf from {tex_file}')
-
-        def call_pdfunite(dest, *origins):
-            cmd = ['pdfunite'] + list(origins) + [dest]
-            with open(os.devnull, 'w') as DEVNULL:
-                try:
-                    subprocess.check_call(cmd, cwd=self.tmp_tex_dir,
-                                          stdout=DEVNULL)
-                except subprocess.CalledProcessError:
-                    raise ValueError(f'Unable to join pdfs into {dest}.')
-
+    def _write_main(self, options, index=0):
         def write_templates():
             with os.scandir(self.template_tex_dir) as it:
                 for entry in it:
@@ -258,26 +414,56 @@ class BOCA(Writer):
 
         write_templates()
         write_main(index)
-        call_pdflatex(os.path.join(self.tmp_tex_dir, 'main.tex'))
-        pdf_file = os.path.join(self.tmp_tex_dir, 'main.pdf')
-        if pdf_front:
-            call_pdfunite(f'{pdf_file}.tmp', pdf_front, pdf_file)
-            shutil.copy(f'{pdf_file}.tmp', pdf_file)
 
-        with open(pdf_file, 'rb') as f:
-            # Remove all special characters and accents
-            # (same process done in _write_id)
-            title = self.problem.statement.title
-            title = unidecode(title.lower())
-            title = ''.join(c for c in title if c.isalnum())
-            self.pzip.writestr(f'description/{title}.pdf', f.read())
+    def _write_pdf(self, pdf_front=''):
+        def cache_key():
+            # Everything pdflatex reads: the TeX files (including main.tex, so
+            # the options and counter), images and examples; plus the cover.
+            parts = []
+            for dir_name in ('tex', 'input', 'output'):
+                for name in self.workspace.list_dir(dir_name):
+                    file = f'{dir_name}/{name}'
+                    parts.extend((file, self.workspace.read(file)))
+            if pdf_front:
+                with open(pdf_front, 'rb') as f:
+                    parts.extend(('front', f.read()))
+            return cache.hash_key(*parts)
+
+        def build_pdf():
+            tex_dir = os.path.join(
+                self.workspace.materialize('tex', 'input', 'output'), 'tex')
+            self._pdflatex('main.tex', tex_dir)
+            pdf_file = os.path.join(tex_dir, 'main.pdf')
+            if pdf_front:
+                self._pdfunite('front.pdf', [pdf_front, pdf_file], tex_dir)
+                pdf_file = os.path.join(tex_dir, 'front.pdf')
+
+            with open(pdf_file, 'rb') as f:
+                return f.read()
+
+        pdf = None
+        if self.cache_dir:
+            pdf_cache = cache.Cache(os.path.join(self.cache_dir, 'pdfs'),
+                                    self.cache_MB)
+            key = cache_key()
+            pdf = pdf_cache.get(key)
+
+        if pdf is None:
+            pdf = build_pdf()
+            if self.cache_dir:
+                pdf_cache.put(key, pdf)
+
+        self._writestr(f'description/{self._basename()}.pdf', pdf)
 
     def _write_solutions(self):
         sol = self.problem.evaluation.solutions
-        for ext, solution in sol[0].items():
-            self.pzip.writestr(f'solutions/main.{ext}', solution)
-        for ext, solution in sol[1].items():
-            self.pzip.writestr(f'solutions/accepted.{ext}', solution)
+        members = [functools.partial(archive.compress,
+                                     f'solutions/{name}.{ext}', solution,
+                                     self.compress_type, self.compresslevel)
+                   for name, solutions in (('main', sol[0]),
+                                           ('accepted', sol[1]))
+                   for ext, solution in solutions.items()]
+        archive.write_all(self.pzip, members, self.zip_threads)
 
     def _write_tags(self):
         self.pzip.writestr('description/tags.csv',
@@ -285,10 +471,26 @@ class BOCA(Writer):
                                     for tag in self.problem.statement.tags))
 
     def _write_tests(self):
-        for tests in self.problem.evaluation.tests.values():
-            for name, files in tests.items():
-                for io, data in files.items():
-                    self.pzip.writestr(f'{io}put/{name}', data)
+        def members():
+            for tests in self.problem.evaluation.tests.values():
+                for name, files in tests.items():
+                    for io in files:
+                        file = f'{io}put/{name}'
+                        if (isinstance(files, problem.TestCase) and
+                                isinstance(files.archive, archive.ZipArchive)):
+                            # Straight from the reader's zip, still compressed
+                            # (unless the smallest zip is wanted).
+                            yield functools.partial(
+                                files.archive.member, files.files[io], file,
+                                self.compress_type, self.compresslevel,
+                                self.compression == 'small')
+                        else:
+                            yield functools.partial(
+                                archive.compress, file, files[io],
+                                self.compress_type, self.compresslevel)
+
+        # Compressed in parallel, but written in order.
+        archive.write_all(self.pzip, members(), self.zip_threads)
 
     def _write_title(self):
         self._write('title', self.problem.statement.title)
@@ -297,7 +499,9 @@ class BOCA(Writer):
         self._write('tutorial', self.problem.statement.tutorial)
 
     def write(self, problem, output_dir='./', tmp_dir='/tmp', add_notes=True,
-              add_tutorial=False, pdf_front='', index=0):
+              add_tutorial=False, pdf_front='', index=0, cache_dir=None,
+              cache_MB=256, pdf=True, compression='default',
+              zip_threads=None, in_memory=True):
         """Writes the given Problem into a BOCA file.
 
         http://bombonera.org/
@@ -318,23 +522,37 @@ class BOCA(Writer):
         Keyword arguments:
         problem -- the Problem containing the data for the problem
         output_dir -- the directory to write the file created
-        tmp_dir -- the directory to write temporary files, if necessary
+        tmp_dir -- the directory to write temporary files, if necessary (in
+                   a subdirectory unique to each call)
         add_notes -- boolean to include (or not) the "notes" in the PDF file
         add_tutorial -- boolean to include (or not) the "tutorial" in the PDF
                         file
         pdf_front -- path to a PDF file to be used as front matter (cover) of
                      the problem's PDF file
+        index -- position of the problem in the contest (for numbering)
+        cache_dir -- directory for caching files between runs (compiled
+                     checkers and PDFs), None disables caching
+        cache_MB -- size limit for each kind of file cached
+        pdf -- boolean to create (or not) the PDF file, which can be done
+               later for several problems at once with write_contest
+        compression -- how the zip members are compressed, one of
+                       BOCA.COMPRESSION ("store", "fast", "default" or
+                       "small"), images and PDFs are always stored
+        zip_threads -- number of threads compressing the tests, solutions and
+                       auxiliary files (None for one per CPU)
+        in_memory -- boolean to keep the files for pdflatex and g++ in memory,
+                     writing them to tmp_dir only when these tools are run
+
+        Returns a list with the path of the file created.
         """
         # Setup
-        if not os.path.isdir(tmp_dir):
-            os.mkdir(tmp_dir)
-
-        self.tmp_dir = os.path.join(tmp_dir, problem.id)
-        if os.path.isdir(self.tmp_dir):
-            shutil.rmtree(self.tmp_dir)
-        os.mkdir(self.tmp_dir)
-        self.tmp_tex_dir = os.path.join(self.tmp_dir, 'tex')
-        os.mkdir(self.tmp_tex_dir)
+        self.cache_dir = cache_dir
+        self.cache_MB = cache_MB
+        if compression not in BOCA.COMPRESSION:
+            raise ValueError(f'Unknown compression "{compression}"')
+        self.compression = compression
+        self.compress_type, self.compresslevel = BOCA.COMPRESSION[compression]
+        self.zip_threads = zip_threads
 
         class_options = []
         if add_notes and problem.statement.notes:
@@ -344,21 +562,175 @@ class BOCA(Writer):
 
         # Processing
         problem_zip = os.path.join(output_dir, f'{problem.id}.zip')
-        cwd = os.path.abspath(os.path.dirname(__file__))
-        self.template_dir = os.path.join(cwd, 'templates', 'BOCA')
-        self.template_tex_dir = os.path.join(self.template_dir, 'tex')
+        self._set_templates()
+
+        # The workspace's directory (if any) is removed afterwards.
+        with workspace.Workspace(tmp_dir, f'{problem.id}-',
+                                 in_memory) as self.workspace:
+            with zipfile.ZipFile(problem_zip, 'w', self.compress_type,
+                                 compresslevel=self.compresslevel) as pzip:
+                self.pzip = pzip
+                super().write(problem, output_dir=output_dir)
+                self._write_main(','.join(class_options), index)
+                if pdf:
+                    if pdf_front:
+                        pdf_front = os.path.join(self.module_dir, pdf_front)
+                    self._write_pdf(pdf_front)
 
-        with zipfile.ZipFile(problem_zip, 'w', zipfile.ZIP_DEFLATED) as pzip:
-            self.pzip = pzip
-            super().write(problem, output_dir=output_dir)
-            if pdf_front:
-                pdf_front = os.path.join(cwd, pdf_front)
-            self._write_pdf(','.join(class_options), pdf_front, index)
+        print(f'\tCreated {problem_zip}.')
+        events.emit('created', path=problem_zip)
+        return [problem_zip]
 
-        # Cleanup
-        shutil.rmtree(self.tmp_dir)
+    def write_contest(self, problem_zips, output_dir='./', tmp_dir='/tmp',
+                      add_notes=True, add_tutorial=False, pdf_front='',
+                      name='contest'):
+        """Creates the PDF files for the given BOCA problems in a single
+        pdflatex run.
 
-        print(f'\tCreated {problem_zip}.')
+        Each problem's PDF is added to its zip file (which must not have one,
+        see the "pdf" argument of write), and the PDF with all the problems
+        is written to output_dir as name.pdf.
+
+        Keyword arguments:
+        problem_zips -- list of (index, path) of the BOCA zip files, where
+                        index is the position of the problem in the contest
+        output_dir -- the directory to write the contest's PDF file
+        tmp_dir -- the directory to write temporary files
+        add_notes -- boolean to include (or not) the "notes" in the PDF files
+        add_tutorial -- boolean to include (or not) the "tutorial" in the PDF
+                        files
+        pdf_front -- path to a PDF file to be used as front matter (cover) of
+                     the PDF files
+        name -- the name of the contest's PDF file
+
+        Returns the path of the contest's PDF file.
+        """
+        def extract(pzip, problem_dir):
+            # Only what pdflatex needs: the "tex" folder and the examples.
+            examples = pzip.read('tex/examples.csv').decode('utf-8')
+            members = [f'{io}put/{e}'
+                       for e in examples.split(',') if e
+                       for io in ('in', 'out')]
+            for entry in pzip.namelist():
+                if entry.startswith('tex/') or entry in members:
+                    pzip.extract(entry, problem_dir)
+
+        def get_descfile(pzip):
+            info = pzip.read('description/problem.info').decode('utf-8')
+            for line in info.splitlines():
+                key, _, value = line.partition('=')
+                if key == 'descfile':
+                    return value
+            raise ValueError('descfile not found in problem.info')
+
+        def has_section(pzip, section):
+            try:
+                return bool(pzip.read(f'tex/{section}.tex').strip())
+            except KeyError:
+                return False
+
+        def problem_tex(num, index, options):
+            lines = []
+            for option in ('notes', 'tutorial'):
+                if option in options:
+                    lines.append(f'\\def\\{option}@boca{{1}}%')
+                else:
+                    lines.append(f'\\let\\{option}@boca\\@undefined%')
+            lines.append(f'\\setcounter{{problemCounter}}{{{index}}}%')
+            lines.append(f'\\problem{{{num}/tex}}%')
+            # Marks the (last) page of the problem in the aux file.
+            lines.append(f'\\label{{convertej:{num}}}%')
+            return '\n'.join(lines)
+
+        def last_pages():
+            pattern = re.compile(r'\\newlabel\{convertej:(\d+)\}'
+                                 r'\{\{.*\}\{(\d+)\}\}$')
+            pages = {}
+            with open(os.path.join(contest_dir, 'main.aux')) as f:
+                for line in f:
+                    if m := pattern.match(line.strip()):
+                        pages[int(m.group(1))] = int(m.group(2))
+            if len(pages) != len(problem_zips):
+                raise ValueError('Unable to find the pages of each problem')
+            return [pages[num] for num in range(len(problem_zips))]
+
+        def split_pdf():
+            self._call(['pdfseparate', 'main.pdf', 'page-%d.pdf'],
+                       'Unable to split main.pdf', contest_dir)
+            first_page = 1
+            for num, last_page in enumerate(last_pages()):
+                pages = [os.path.join(contest_dir, f'page-{p}.pdf')
+                         for p in range(first_page, last_page + 1)]
+                first_page = last_page + 1
+                pdf_file = os.path.join(contest_dir, f'problem-{num}.pdf')
+                if pdf_front:
+                    pages.insert(0, pdf_front)
+                if len(pages) > 1:
+                    self._pdfunite(pdf_file, pages, contest_dir)
+                else:
+                    shutil.copy(pages[0], pdf_file)
+                yield pdf_file
+
+        # Setup
+        self._set_templates()
+        if not os.path.isdir(tmp_dir):
+            os.mkdir(tmp_dir)
+        contest_dir = os.path.abspath(tempfile.mkdtemp(prefix=f'{name}-',
+                                                       dir=tmp_dir))
+        if pdf_front:
+            pdf_front = os.path.join(self.module_dir, pdf_front)
+
+        try:
+            # Processing
+            descfiles = []
+            problems = []
+            for num, (index, problem_zip) in enumerate(problem_zips):
+                with zipfile.ZipFile(problem_zip) as pzip:
+                    extract(pzip, os.path.join(contest_dir, str(num)))
+                    descfiles.append(get_descfile(pzip))
+                    options = [section
+                               for section, add in (('notes', add_notes),
+                                                    ('tutorial', add_tutorial))
+                               if add and has_section(pzip, section)]
+                problems.append(problem_tex(num, index, options))
+
+            with os.scandir(self.template_tex_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name != 'main.tex':
+                        shutil.copy(entry.path, contest_dir)
+
+            with open(os.path.join(contest_dir, 'main.tex'), 'w') as f:
+                f.write('\\documentclass{boca}%\n'
+                        '\\makeatletter%\n'
+                        '\\begin{document}%\n' +
+                        '\n'.join(problems) +
+                        '\n\\end{document}%\n')
+
+            self._pdflatex('main.tex', contest_dir)
+
+            problem_paths = [path for _, path in problem_zips]
+            for problem_zip, descfile, pdf_file in zip(
+                    problem_paths, descfiles, split_pdf()):
+                with zipfile.ZipFile(problem_zip, 'a') as pzip:
+                    pzip.write(pdf_file, f'description/{descfile}',
+                               zipfile.ZIP_STORED)
+                print(f'\tAdded {descfile} to {problem_zip}.')
+                events.emit('updated', path=problem_zip)
+
+            contest_pdf = os.path.join(output_dir, f'{name}.pdf')
+            pdf_file = os.path.join(contest_dir, 'main.pdf')
+            if pdf_front:
+                self._pdfunite(os.path.abspath(contest_pdf),
+                               [pdf_front, pdf_file], contest_dir)
+            else:
+                shutil.copy(pdf_file, contest_pdf)
+        finally:
+            # Cleanup, even if anything failed.
+            shutil.rmtree(contest_dir, ignore_errors=True)
+
+        print(f'\tCreated {contest_pdf}.')
+        events.emit('created', path=contest_pdf)
+        return contest_pdf
 
 
 class CodeRunner(Writer):
@@ -381,6 +753,9 @@ class CodeRunner(Writer):
                         'py': 'python3'},
              'raster images': ('jpeg', 'jpg', 'gif', 'png')}
 
+    # Elements of the question that depend on the solution's language.
+    LANGUAGE_TAGS = ('answer', 'coderunnertype', 'sandboxparams')
+
     def __init__(self):
         cwd = os.path.abspath(os.path.dirname(__file__))
         template_path = os.path.join(cwd, 'templates', 'CodeRunner')
@@ -391,7 +766,7 @@ class CodeRunner(Writer):
         def find_source(lang):
             for solutions in self.problem.evaluation.solutions:
                 if lang in solutions.keys():
-                    return solutions[lang]
+                    return to_text(solutions[lang])
             raise ValueError(f'No {lang} solution')
 
         answer = self.root.find('answer')
@@ -418,7 +793,7 @@ class CodeRunner(Writer):
         # Handle the CDEnd string "]]>".
         content = re.sub(r']]>', r']]&gt;', content)
         # Include the CDATA tag on the element.
-        element = ET.Element('![CDATA[')
+        element = ET.Element(CDATA_TAG)
         element.text = content
         return element
 
@@ -429,6 +804,66 @@ class CodeRunner(Writer):
             return f'<{tag}{options}>{text}</{tag}>'
         return text
 
+    def _serialize(self):
+        """Yields the XML of the question in pieces, so it can be written to a
+        file without having all of it (tests and images) in memory.
+
+        Each piece is either text or an element that depends on the language
+        of the solution (see LANGUAGE_TAGS), to be serialized separately.
+        """
+        def use_as_example(key):
+            return '1' if key == 'examples' else '0'
+
+        def set_test(test, key):
+            root = clone(template)
+            root.find("stdin").find("text").text = to_text(test['in'])
+            root.find("expected").find("text").text = to_text(test['out'])
+            root.set("useasexample", use_as_example(key))
+            return root
+
+        def tests():
+            for key, tests in self.problem.evaluation.tests.items():
+                for case in tests.values():
+                    yield serialize(set_test(case, key))
+
+        def images():
+            chunk_size = 3 * 2 ** 16  # Multiple of 3 for base64 to split.
+            for name, data in self.images:
+                img = ET.Element('file')
+                img.set('name', name)
+                img.set('path', '/')
+                img.set('encoding', 'base64')
+                yield start_tag(img)
+                for i in range(0, len(data), chunk_size):
+                    yield str(base64.b64encode(data[i:i + chunk_size]), 'utf-8')
+                yield end_tag(img)
+
+        template = parse_template(self.test_xml)
+        quiz = self.tree.getroot()
+
+        yield start_tag(quiz)
+        yield start_tag(self.root)
+        for element in self.root:
+            if element.tag in CodeRunner.LANGUAGE_TAGS:
+                yield element
+            elif element.tag == 'testcases':
+                yield start_tag(element)
+                yield from tests()
+                yield end_tag(element)
+            elif element.tag == 'questiontext':
+                yield start_tag(element)
+                for child in element:
+                    yield serialize(child)
+                yield from images()
+                yield end_tag(element)
+            else:
+                yield serialize(element)
+        yield end_tag(self.root)
+        yield end_tag(quiz)
+
+    def _serialize_element(self, element):
+        return serialize(element).encode('utf-8', 'xmlcharrefreplace')
+
     def _set_languages(self, src_lang, solutions):
         languages = set(CodeRunner.FILES['source'].keys()
                         if src_lang == 'all' else [src_lang])
@@ -441,163 +876,77 @@ class CodeRunner(Writer):
         self.root.find(name).text = str(value)
 
     def _tex2html(self, s):
-        def environments(s):
-            # Process item before the environment, using \ as end delimiter.
-            s = re.sub(r'\\item ([.\s\S]*?)(?=\\item|\\end)', r'<li>\1</li>\n',
-                       s)
-            repl = {'itemize': 'ul', 'enumerate': 'ol'}
-            for env, t in repl.items():
-                s = re.sub(f'\\\\begin{{{env}}}([.\s\S]*?)\\\\end{{{env}}}',
-                           self._html_tag(r'\1', t), s)
-
-            s = re.sub(r'\\begin{center}([.\s\S]*?)\\end{center}',
-                       self._html_tag(r'\1', 'p',
-                                      'style="text-align: center;"'),
-                       s)
-            s = re.sub(r'\\begin{verbatim}([.\s\S]*?)\\end{verbatim}',
-                       self._html_tag(r'\1', 'pre', ''), s)
-
-            return s
-
-        def font(s):
-            repl = {'textbf': 'b', 'bf': 'b',
-                    'textit': 'i', 'it': 'i', 'emph': 'i',
-                    'textrm': None,
-                    'texttt': 'tt', 'tt': 'tt',
-                    't': 'tt'}  # This has issues with nested tags...
-            for cmd, t in repl.items():
-                s = re.sub(f'\\\\{cmd}{{(.*?)}}',
-                           self._html_tag('\\1', tag=t),
-                           s)
-            return s
-
-        def images(s):
-            def parse(options):
-                opts = []
-
-                if options:
-                    options = options.lower()
-
-                    pattern = r'scale.*?= *([0-9]*\.?[0-9]+)'
-                    m = re.search(pattern, options)
-                    if m:
-                        width = int(float(m.group(1)) * 100)
-                        opts.append(f'width="{width}%"')
-                    else:
-                        pattern = r'width.*?= *([0-9]*\.?[0-9]+)' \
-                                  ' *\\textwidth'
-                        m = re.search(pattern, options)
-                        if m:
-                            width = int(float(m.group(1)) * 100)
-                            opts.append(f'width="{width}%"')
-                        else:
-                            print(f'\tImage {file} has unknown options '
-                                  '({options}).')
-
-                return ' '.join(o for o in opts)
-
-            def check_file(file):
-                if file in self.problem.statement.aux_files:
-                    return file
-
-                # Extension may have been omitted
-                for img in self.problem.statement.aux_files:
-                    if img.startswith(f'{file.lower()}'):
-                        return img
-                raise ValueError(f'Cannot find {file} image')
-
-            pattern = r'\\includegraphics([\[].*[\]])?{(.*?)}'
-            for options, file in re.findall(pattern, s):
-                c_file = check_file(file)
-                options = parse(options)
-
-                pattern = f'\\\\includegraphics.*?{{{file}}}'
-                image = f'src="@@PLUGINFILE@@/{c_file}" {options}'
-                s = re.sub(pattern, self._html_tag(' ', 'img', image), s)
-            return s
-
-        def math(s):
-            s = re.sub(r'\$\$([.\s\S]*?)\$\$', '\\[\\1\\]', s)
-            s = re.sub(r'\$([^\$]*)\$', '\\(\\1\\)', s)
-            return s
-
-        def text(s):
-            s = re.sub(r'``(.*?)\'\'', '"\\1"', s)
-            s = re.sub(r'`(.*?)\'', '\'\\1\'', s)
-            s = re.sub(r'\\mbox{(.*?)}', '\\1', s)
-            s = re.sub(r'\n\n', '\n</p>\n<p>\n', s)
-            s = re.sub(r'\\textbackslash', r'\\', s)
-
-            no_math = re.sub(r'(\\[\(\[].*?\\[\)\]])', '', s)
-            for cmd in re.findall(r'(\\\w+)', no_math):
-                print(f'\tPossible unformatted TeX command: {cmd}')
-
-            return s
-
-        s = math(s)
-        s = font(s)
-        s = images(s)
-        s = environments(s)
-        s = text(s)  # must be processed after "math"
-
-        return s
+        aux_files = tuple(sorted(self.problem.statement.aux_files))
+        html_cache = (os.path.join(self.cache_dir, 'html')
+                      if self.cache_dir else None)
+        html, warnings = tex.cached_to_html(s, aux_files, html_cache,
+                                            self.cache_MB)
+        for warning in warnings:
+            print(f'\t{warning}')
+            events.emit('warning', message=warning)
+        return html
 
     def _write_aux_files(self):
-        def convert_png(img_file, data, cmd):
-            if shutil.which(cmd[0]):
-                print(f'\tConverting {img_file} to PNG')
-                with open(img_file, 'wb') as f:
-                    f.write(data)
-                root, _ = os.path.splitext(img_file)
-                dest = f'{root}.png'
-                with open(os.devnull, 'w') as DEVNULL:
-                    try:
-                        subprocess.check_call(cmd, stdout=DEVNULL)
-                    except subprocess.CalledProcessError:
-                        if os.path.exists(img_file):
-                            os.remove(img_file)
-                        raise ValueError('Unable to create PNG'
-                                         f' from {img_file}')
-                        # try:
-                        #     # run again to show errors
-                        #     subprocess.check_call(cmd)
-                        # except Exception:
-                        #     raise ValueError('Unable to create PNG '
-                        #                      f'from {img_file}')
-
-                if os.path.exists(img_file):
-                    os.remove(img_file)
-
-                with open(dest, 'rb') as f:
-                    data = f.read()
-                if os.path.exists(dest):
-                    os.remove(dest)
-
-                return dest, data
-            else:
-                print(f'\tUnable to create PNG from {img_file}')
-
-            return img_file, data
-
-        for name, data in self.problem.statement.aux_files.items():
+        def png_command(name):
             root, ext = os.path.splitext(name)
             if ext.lower() == '.pdf':
-                name, data = convert_png(name, data,
-                                         ['pdftoppm', name, root, '-png'])
-            elif ext.lower() == '.eps':
-                name, data = convert_png(name, data,
-                                         ['convert',
-                                          '-colorspace', 'RGB',
-                                          '-density', '600',
-                                          name, f'{root}.png'])
-
-            if name.lower().endswith(CodeRunner.FILES['raster images']):
-                img = ET.Element('file')
-                img.set('name', name)
-                img.set('path', '/')
-                img.set('encoding', 'base64')
-                img.text = str(base64.b64encode(data), 'utf-8')
-                self.root.find('questiontext').append(img)
+                return ['pdftoppm', '-singlefile', '-png', name, root]
+            if ext.lower() == '.eps':
+                return ['convert', '-colorspace', 'RGB', '-density', '600',
+                        name, f'{root}.png']
+            return None
+
+        def convert_png(name, data, cmd):
+            if not shutil.which(cmd[0]):
+                print(f'\tUnable to create PNG from {name}')
+                events.emit('warning',
+                            message=f'Unable to create PNG from {name}')
+                return name, data
+
+            dest = f'{os.path.splitext(name)[0]}.png'
+            if self.cache_dir:
+                png_cache = cache.Cache(os.path.join(self.cache_dir, 'images'),
+                                        self.cache_MB)
+                key = cache.hash_key(' '.join(cmd), data)
+                if (png := png_cache.get(key)) is not None:
+                    return dest, png
+
+            print(f'\tConverting {name} to PNG')
+            # Each conversion in its own directory, so they can run in
+            # parallel.
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                with open(os.path.join(tmp_dir, name), 'wb') as f:
+                    f.write(data)
+                tools.run(cmd, f'Unable to create PNG from {name}', tmp_dir)
+                with open(os.path.join(tmp_dir, dest), 'rb') as f:
+                    png = f.read()
+
+            if self.cache_dir:
+                png_cache.put(key, png)
+            return dest, png
+
+        aux_files = self.problem.statement.aux_files.items()
+        commands = [png_command(name) for name, _ in aux_files]
+        if not any(commands):
+            images = aux_files
+        else:
+            import concurrent.futures
+
+            # How many tools run at the same time is limited by tools.run.
+            workers = min(sum(1 for cmd in commands if cmd),
+                          os.cpu_count() or 1)
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                futures = [executor.submit(profiling.propagate(convert_png),
+                                           name, data, cmd)
+                           if cmd else None
+                           for (name, data), cmd in zip(aux_files, commands)]
+                images = [future.result() if future else aux_file
+                          for aux_file, future in zip(aux_files, futures)]
+
+        # Written (encoded) along with the question text, in _serialize.
+        self.images = [(name, data) for name, data in images
+                       if name.lower().endswith(
+                           CodeRunner.FILES['raster images'])]
 
     def _write_checker(self):
         pass
@@ -661,20 +1010,8 @@ class CodeRunner(Writer):
             tags.append(te)
 
     def _write_tests(self):
-        def use_as_example(key):
-            return '1' if key == 'examples' else '0'
-
-        def set_test(test, key):
-            xml = os.path.join(self.test_xml)
-            root = ET.parse(xml).getroot()
-            root.find("stdin").find("text").text = test['in']
-            root.find("expected").find("text").text = test['out']
-            root.set("useasexample", use_as_example(key))
-            return root
-
-        for key, tests in self.problem.evaluation.tests.items():
-            for case in tests.values():
-                self.root.find("testcases").append(set_test(case, key))
+        # Done in _serialize, one test at a time.
+        pass
 
     def _write_title(self):
         self.root.find('name').find('text').text = self.problem.statement.title
@@ -685,7 +1022,8 @@ class CodeRunner(Writer):
             self.root.find('generalfeedback').find('text').text = tutorial
 
     def write(self, problem, output_dir='./', src_lang='all',
-              all_or_nothing=False, penalty_after=2):
+              all_or_nothing=False, penalty_after=2, cache_dir=None,
+              cache_MB=256):
         """Writes the given Problem into a CodeRunner file.
 
         Keyword arguments:
@@ -695,22 +1033,13 @@ class CodeRunner(Writer):
         all_or_nothing -- boolean defining the all-or-nothing marking behavior
         penalty_after -- start the penalty regime (10% per mistake) after this
                          number of attempts
-        """
-        #######################################################################
-        # CDATA parsing isn't supported natively, so it needs an override.
-        _serialize_xml = ET._serialize_xml
-
-        def _serialize_xml_with_CDATA(write, elem, qnames, namespaces,
-                                      short_empty_elements, **kwargs):
-            if elem.tag == '![CDATA[':
-                write("\n<{}{}]]>\n".format(elem.tag, elem.text))
-            else:
-                return _serialize_xml(write, elem, qnames, namespaces,
-                                      short_empty_elements, **kwargs)
-
-        ET._serialize_xml = ET._serialize['xml'] = _serialize_xml_with_CDATA
-        #######################################################################
+        cache_dir -- directory for caching files between runs (HTML converted
+                     from TeX and images converted to PNG), None disables
+                     caching
+        cache_MB -- size limit for each kind of file cached
 
+        Returns a list with the paths of the files created.
+        """
         # Parse arguments #####################################################
         languages = self._set_languages(src_lang, problem.evaluation.solutions)
         if not languages:
@@ -720,8 +1049,11 @@ class CodeRunner(Writer):
             raise ValueError(f'Penalty {penalty_after} cannot be negative')
         #######################################################################
 
-        tree = ET.parse(self.problem_xml)
-        self.root = tree.getroot()[0]  # question root
+        self.cache_dir = cache_dir
+        self.cache_MB = cache_MB
+
+        self.tree = ET.parse(self.problem_xml)
+        self.root = self.tree.getroot()[0]  # question root
 
         super().write(problem, output_dir=output_dir)
 
@@ -731,17 +1063,45 @@ class CodeRunner(Writer):
                                    ['10', '20', '...'])
         self._set_text('penaltyregime', penalty_regime)
 
+        # The first file is serialized in full, recording which parts do not
+        # depend on the language. Those are copied from it to the other files.
+        files = []
+        parts = []  # Language specific tags or [start, end] of common bytes.
         for lang in languages:
             self._add_solution(lang)
             self._add_flags(lang)
 
             file = os.path.join(output_dir, f'{problem.id}-{lang}.xml')
-            tree.write(file, 'UTF-8')
+            with open(file, 'wb') as f:
+                if not files:
+                    for piece in self._serialize():
+                        if isinstance(piece, str):
+                            start = f.tell()
+                            f.write(piece.encode('utf-8', 'xmlcharrefreplace'))
+                            if parts and isinstance(parts[-1], list):
+                                parts[-1][1] = f.tell()
+                            else:
+                                parts.append([start, f.tell()])
+                        else:
+                            parts.append(piece.tag)
+                            f.write(self._serialize_element(piece))
+                else:
+                    with open(files[0], 'rb') as first:
+                        for part in parts:
+                            if isinstance(part, str):
+                                f.write(self._serialize_element(
+                                    self.root.find(part)))
+                            else:
+                                first.seek(part[0])
+                                copy_bytes(first, f, part[1] - part[0])
+                profiling.count(f.tell())
+
             print(f'\tCreated {file}.')
+            events.emit('created', path=file)
+            files.append(file)
 
         self.root = None
+        self.tree = None
+        self.images = None
 
-        #######################################################################
-        # Undo override to handle CDATA.
-        ET._serialize_xml = ET._serialize['xml'] = _serialize_xml
-        #######################################################################
+        return files
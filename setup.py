@@ -22,6 +22,7 @@ setup(
         "Programming Language :: Python :: 3.7",
     ],
     packages=["convert_ej"],
+    install_requires=["unidecode"],
     include_package_data=True,
     entry_points={
         "console_scripts": [